@@ -3,127 +3,831 @@ import pathlib
 import os
 import psutil
 import subprocess
+import threading
+import time
+import hashlib
+import signal
+import json
+from concurrent.futures import Future, ThreadPoolExecutor
 sys.path.append(str(pathlib.Path(__file__).resolve().parents[2]))
 
 from vicmil_pip.lib.pyUtil import get_directory_path
-from vicmil_pip.lib.pyAppManager.git_util import clone_repo_using_ssh_key, pull_latest_changes_using_ssh_key, generate_ssh_keypair, list_branches_using_ssh_key
+from vicmil_pip.lib.pyAppManager.git_util import clone_repo_using_ssh_key, pull_latest_changes_using_ssh_key, generate_ssh_keypair, list_branches_using_ssh_key, update_bare_mirror_using_ssh_key, add_worktree_from_mirror, list_branch_heads_using_ssh_key
+from vicmil_pip.lib.pyAppManager.resource_limits_util import validate_resource_limits, prepare_resource_limits, popen_with_resource_limits
+from vicmil_pip.lib.pyAppManager.metrics_util import MetricsHistoryStore, DEFAULT_RESOLUTIONS, format_prometheus_metric
+from vicmil_pip.lib.pyAppManager.job_util import run_subprocess
 from vicmil_pip.lib.pyUtil import *
 
 
-def run_python_app_command(python_path, app_file, log_file, pid_file):
+class ProcessRegistry:
+    """
+    Keeps one psutil.Process handle per app, identified by (pid, create_time), so a recycled
+    PID is never mistaken for a running app.
+    Pid files are only a persistence fallback: they are read once per pid_dir (e.g. after a
+    manager restart) and written whenever a process is registered.
+    Processes started by this manager also keep their subprocess.Popen handle, which is
+    used to reap them as soon as they exit.
+    """
+    def __init__(self):
+        self._processes = {}  # pid_dir -> {app_name: psutil.Process}
+        self._popens = {}  # pid_dir -> {app_name: subprocess.Popen}
+        self._exit_codes = {}  # (pid_dir, app_name) -> exit code of the last process that exited
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def pid_file_path(pid_dir: str, app_name: str) -> str:
+        return os.path.join(pid_dir, f"{app_name}_pid.txt")
+
+    @staticmethod
+    def _is_alive(process: psutil.Process) -> bool:
+        try:
+            # is_running() also compares create_time, which protects against pid reuse
+            return process.is_running() and process.status() != psutil.STATUS_ZOMBIE
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return False
+
+    @staticmethod
+    def _read_pid_file(pid_file: str) -> psutil.Process | None:
+        """
+        Read a pid file written as "<pid>\n<create_time>" (or just "<pid>" by older versions).
+        Returns None if the process is gone or the pid has been reused by another process.
+        """
+        try:
+            with open(pid_file, "r") as f:
+                parts = f.read().split()
+            pid = int(parts[0])
+            create_time = float(parts[1]) if len(parts) > 1 else None
+            process = psutil.Process(pid)
+            if create_time is not None:
+                if abs(process.create_time() - create_time) > 0.01:
+                    return None
+            elif process.create_time() > os.path.getmtime(pid_file) + 1:
+                # Legacy pid file: the process was created after the file was written
+                return None
+            return process
+        except (OSError, ValueError, IndexError, psutil.NoSuchProcess, psutil.AccessDenied):
+            return None
+
+    def _apps(self, pid_dir: str) -> dict:
+        apps = self._processes.get(pid_dir)
+        if apps is None:
+            apps = {}
+            if os.path.isdir(pid_dir):
+                for entry in os.listdir(pid_dir):
+                    if not entry.endswith("_pid.txt"):
+                        continue
+                    pid_file = os.path.join(pid_dir, entry)
+                    process = self._read_pid_file(pid_file)
+                    if process is not None and self._is_alive(process):
+                        apps[entry[:-len("_pid.txt")]] = process
+                    else:
+                        # Cleanup if process not running
+                        os.remove(pid_file)
+            self._processes[pid_dir] = apps
+        return apps
+
+    def register(self, pid_dir: str, app_name: str, pid: int, popen: subprocess.Popen | None = None) -> psutil.Process:
+        """Register a newly started process for the app, and persist it to the pid file."""
+        process = psutil.Process(pid)
+        with self._lock:
+            self._apps(pid_dir)[app_name] = process
+            if popen is not None:
+                self._popens.setdefault(pid_dir, {})[app_name] = popen
+            os.makedirs(pid_dir, exist_ok=True)
+            with open(self.pid_file_path(pid_dir, app_name), "w") as f:
+                f.write(f"{process.pid}\n{process.create_time()}\n")
+        return process
+
+    def unregister(self, pid_dir: str, app_name: str):
+        with self._lock:
+            self._apps(pid_dir).pop(app_name, None)
+            self._popens.get(pid_dir, {}).pop(app_name, None)
+            pid_file = self.pid_file_path(pid_dir, app_name)
+            if os.path.exists(pid_file):
+                os.remove(pid_file)
+
+    def get(self, pid_dir: str, app_name: str) -> psutil.Process | None:
+        """Returns the process of the app if it is running, and forgets it otherwise."""
+        with self._lock:
+            process = self._apps(pid_dir).get(app_name)
+            if process is None:
+                return None
+            popen = self._popens.get(pid_dir, {}).get(app_name)
+            if popen is not None:
+                # poll() also reaps the process if it has exited
+                exit_code = popen.poll()
+                alive = exit_code is None
+            else:
+                # The exit code of processes that are not children of the manager is unknown
+                exit_code = None
+                alive = self._is_alive(process)
+            if alive:
+                return process
+            self._exit_codes[(pid_dir, app_name)] = exit_code
+            self.unregister(pid_dir, app_name)
+            return None
+
+    def get_exit_code(self, pid_dir: str, app_name: str) -> int | None:
+        """Returns the exit code of the last process of the app that exited (None if unknown)."""
+        with self._lock:
+            return self._exit_codes.get((pid_dir, app_name))
+
+    def get_popen(self, pid_dir: str, app_name: str) -> subprocess.Popen | None:
+        """Returns the Popen handle of the app, if it was started by this manager."""
+        with self._lock:
+            return self._popens.get(pid_dir, {}).get(app_name)
+
+    def registered_names(self, pid_dir: str) -> list[str]:
+        """Names of all processes registered in pid_dir, without checking if they are still running."""
+        with self._lock:
+            return list(self._apps(pid_dir))
+
+    def running_apps(self, pid_dir: str) -> dict:
+        """Returns {app_name: psutil.Process} for all running apps in pid_dir."""
+        with self._lock:
+            result = {}
+            for app_name in list(self._apps(pid_dir)):
+                process = self.get(pid_dir, app_name)
+                if process is not None:
+                    result[app_name] = process
+            return result
+
+
+process_registry = ProcessRegistry()
+
+
+_app_locks = {}  # app_name -> RLock
+_app_locks_lock = threading.Lock()
+
+
+def get_app_lock(app_name: str) -> threading.RLock:
+    """
+    Lock held while an app is started, stopped, cloned or pulled, so operations on the same app never overlap.
+    It is reentrant, so e.g. stop and pull can be done as one step.
+    """
+    with _app_locks_lock:
+        lock = _app_locks.get(app_name)
+        if lock is None:
+            lock = _app_locks[app_name] = threading.RLock()
+        return lock
+
+
+def get_app_instance_name(app_name: str, replica: int | None = None) -> str:
+    """Name a process of the app is registered as: app_name, or app_name.<replica> for apps with replicas."""
+    return app_name if replica is None else f"{app_name}.{replica}"
+
+
+def get_app_of_instance(instance_name: str) -> str:
+    """Inverse of get_app_instance_name (app names cannot contain dots)."""
+    app_name, _, replica = instance_name.rpartition(".")
+    return app_name if app_name and replica.isdigit() else instance_name
+
+
+def get_app_instances(pid_dir: str, app_name: str) -> list[str]:
+    """Registered process names of an app, e.g. ["hello_world"] or ["hello_world.0", "hello_world.1"]"""
+    return [name for name in process_registry.registered_names(pid_dir) if get_app_of_instance(name) == app_name]
+
+
+def _combine_usage(usages: list[dict]) -> dict:
+    """Usage of an app with several replicas, from the usage of each replica."""
+    combined = {
+        "cpu_percent": sum(usage["cpu_percent"] for usage in usages),
+        "memory_mb": sum(usage["memory_mb"] for usage in usages),
+        "replicas": len(usages)
+    }
+    if all("started_at" in usage for usage in usages):
+        combined["started_at"] = min(usage["started_at"] for usage in usages)
+    return combined
+
+
+def launch_python_app(python_path: str, app_file: str, log_file: str, env: dict | None = None, resource_limits: dict | None = None) -> subprocess.Popen:
+    """
+    Start app_file in the background, in its own session/process group (so it can be signalled as a group),
+    with stdout and stderr appended to log_file.
+    resource_limits (see prepare_resource_limits) are applied before the app starts, it is not started if that fails.
+    """
+    kwargs = {}
     if platform.system() == "Windows":
-        # PowerShell command
-        command = f'Start-Process -NoNewWindow -FilePath "{python_path}" -ArgumentList "-u","{app_file}" -RedirectStandardOutput "{log_file}" -RedirectStandardError "{log_file}" -PassThru | ForEach-Object {{ $_.Id > "{pid_file}" }}'
+        kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
     else:
-        # Linux/macOS command
-        command = f'nohup "{python_path}" -u "{app_file}" >> "{log_file}" 2>&1 & echo $! > "{pid_file}"'
-    
-    print("Running command:", command)
-    os.system(command)
+        kwargs["start_new_session"] = True
+
+    print("Launching:", python_path, "-u", app_file)
+    # The child gets its own copy of the file descriptor, so it can be closed here right away
+    with open(log_file, "ab") as log:
+        kwargs.update(stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, env=env, close_fds=True)
+        if resource_limits is not None:
+            return popen_with_resource_limits([python_path, "-u", app_file], resource_limits, **kwargs)
+        return subprocess.Popen([python_path, "-u", app_file], **kwargs)
+
+
+def _requirements_fingerprint(requirements_path: str) -> str:
+    """Hash of the requirements file content and the interpreter the virtual environment is created with."""
+    with open(requirements_path, "rb") as f:
+        digest = hashlib.sha256(f.read())
+    digest.update(sys.version.encode("utf-8"))
+    digest.update(sys.executable.encode("utf-8"))
+    return digest.hexdigest()
+
+
+_wheelhouse_lock = threading.Lock()
+
+
+def install_requirements_from_wheelhouse(python_path: str, requirements_path: str, wheelhouse_dir: str):
+    """
+    Install requirements offline from a wheelhouse directory shared by all apps.
+    Wheels that are missing from the wheelhouse are built (or downloaded) into it once, and then reused by every app.
+    On an air-gapped host, a pre-filled wheelhouse is enough to install.
+    """
+    os.makedirs(wheelhouse_dir, exist_ok=True)
+    install_cmd = [python_path, "-m", "pip", "install", "--no-index", "--find-links", wheelhouse_dir, "-r", requirements_path]
+
+    if run_subprocess(install_cmd, check=False).returncode == 0:
+        return
+
+    # Some wheels are missing, add them to the wheelhouse (one app at a time, to not build the same wheel twice)
+    print("Adding missing wheels to wheelhouse:", wheelhouse_dir)
+    with _wheelhouse_lock:
+        run_subprocess([python_path, "-m", "pip", "wheel", "--find-links", wheelhouse_dir, "--wheel-dir", wheelhouse_dir, "-r", requirements_path])
+    run_subprocess(install_cmd)
+
+
+def install_app_requirements(venv_path: str, requirements_path: str, wheelhouse_dir: str | None = None) -> bool:
+    """
+    Create the virtual environment and pip install the requirements into it,
+    unless they were already installed from an identical requirements file by the same interpreter.
+    The fingerprint of the last successful install is stored in venv_path/.requirements_hash
+    If wheelhouse_dir is set, requirements are installed from the shared wheelhouse (see install_requirements_from_wheelhouse)
+
+    Returns:
+        bool: True if the requirements were installed, False if the install was skipped
+    """
+    marker_file = os.path.join(venv_path, ".requirements_hash")
+    fingerprint = _requirements_fingerprint(requirements_path)
+
+    if os.path.exists(marker_file) and os.path.exists(get_python_executable(venv_path)):
+        with open(marker_file, "r") as f:
+            if f.read().strip() == fingerprint:
+                print("Requirements unchanged, skipping install")
+                return False
+
+    python_virtual_environment(venv_path)
+    if wheelhouse_dir:
+        install_requirements_from_wheelhouse(get_python_executable(venv_path), requirements_path, wheelhouse_dir)
+    else:
+        run_subprocess([get_python_executable(venv_path), "-m", "pip", "install", "-r", requirements_path])
+
+    with open(marker_file, "w") as f:
+        f.write(fingerprint)
+    return True
+
+
+APP_CONFIG_FILE = "app_config.json"
+
+
+def load_app_config(app_path: str) -> dict:
+    """
+    Read the optional app_config.json of an app, e.g.
+    {"replicas": 4, "base_port": 10001, "limits": {"memory_mb": 512, "cpu_percent": 50, "max_open_files": 1024, "nice": 10}}
+    - replicas: number of processes to run, replica i gets the environment variable PORT=base_port+i
+    - limits: see resource_limits_util.RESOURCE_LIMIT_KEYS for the supported limits
+    """
+    config_path = os.path.join(app_path, APP_CONFIG_FILE)
+    if not os.path.exists(config_path):
+        return {}
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"{config_path} must contain a JSON object")
+    validate_resource_limits(config.get("limits", {}))
+    replicas = config.get("replicas", 1)
+    base_port = config.get("base_port")
+    if not isinstance(replicas, int) or replicas < 1:
+        raise ValueError("replicas must be a positive integer")
+    if base_port is not None and not isinstance(base_port, int):
+        raise ValueError("base_port must be an integer")
+    if replicas > 1 and base_port is None:
+        raise ValueError("base_port is required when replicas > 1, every replica listens on its own port")
+    return config
 
 
-def start_app(app_dir: str, pid_dir: str, log_dir: str, app_name: str):
+def start_app(app_dir: str, pid_dir: str, log_dir: str, app_name: str, wheelhouse_dir: str | None = None, cgroup_root: str | None = None, replica: int | None = None):
     """
     Starts a Python app from a given directory.
     - Creates virtualenv if requirements.txt exists
-    - Installs dependencies
-    - Runs app.py in the background
-    - Saves PID to pid_dir/app_name_pid.txt
-    """
-    app_path = os.path.join(app_dir, app_name)
-    venv_path = os.path.join(app_path, "venv")
-    requirements_path = os.path.join(app_path, "requirements.txt")
-    app_file = os.path.join(app_path, "app.py")
-    pid_file = os.path.join(pid_dir, f"{app_name}_pid.txt")
-    log_file = os.path.join(log_dir, f"{app_name}.log")
-
-    if is_app_running(pid_dir=pid_dir, app_name=app_name):
-        print("Process already started!")
-        return
+    - Installs dependencies (unless requirements.txt is unchanged since the last install),
+      from the shared wheelhouse_dir if set
+    - Runs app.py in the background, once per replica in app_config.json (only `replica` if set),
+      with PORT set to base_port + replica
+    - Applies the resource limits in app_config.json, memory and cpu quotas in a cgroup below cgroup_root
+      (shared by all replicas)
+    - Registers the processes, and saves PIDs to pid_dir/app_name_pid.txt (pid_dir/app_name.<replica>_pid.txt)
+    """
+    with get_app_lock(app_name):
+        app_path = os.path.join(app_dir, app_name)
+        venv_path = os.path.join(app_path, "venv")
+        requirements_path = os.path.join(app_path, "requirements.txt")
+        app_file = os.path.join(app_path, "app.py")
+        log_file = os.path.join(log_dir, f"{app_name}.log")
+
+        app_config = load_app_config(app_path)
+        base_port = app_config.get("base_port")
+        if replica is not None:
+            replicas = [replica]
+        elif app_config.get("replicas", 1) > 1:
+            replicas = list(range(app_config["replicas"]))
+        else:
+            replicas = [None]
+
+        # Only start the replicas that are not running
+        replicas = [i for i in replicas if process_registry.get(pid_dir, get_app_instance_name(app_name, i)) is None]
+        if not replicas:
+            print("Process already started!")
+            return
 
-    os.makedirs(pid_dir, exist_ok=True)
-    os.makedirs(log_dir, exist_ok=True)
+        os.makedirs(pid_dir, exist_ok=True)
+        os.makedirs(log_dir, exist_ok=True)
 
-    # 1. Create virtual environment if requirements exist
-    if os.path.exists(requirements_path):
-        python_virtual_environment(venv_path)
-        pip_install_requirements_file_in_virtual_environment(env_directory_path=venv_path, requirements_file_path=requirements_path)
+        # 1. Create virtual environment if requirements exist (skipped if they are unchanged since last install)
+        if os.path.exists(requirements_path):
+            install_app_requirements(venv_path, requirements_path, wheelhouse_dir=wheelhouse_dir)
 
-    # 2. Start the app
+        # 2. Start the app with its resource limits applied before exec, and register the processes
+        python_path = get_python_executable(venv_path)
+        resource_limits = prepare_resource_limits(app_config.get("limits", {}), cgroup_root=cgroup_root, cgroup_name=app_name)
+        for i in replicas:
+            instance_name = get_app_instance_name(app_name, i)
+            env = None
+            if base_port is not None:
+                env = dict(os.environ, PORT=str(base_port + (i or 0)), APP_REPLICA=str(i or 0))
+            popen = launch_python_app(python_path, app_file, log_file, env=env, resource_limits=resource_limits)
+            process_registry.register(pid_dir, instance_name, popen.pid, popen=popen)
+            print(f"{instance_name} started. PID saved to {process_registry.pid_file_path(pid_dir, instance_name)}")
 
-    python_path = get_python_executable(venv_path)
-    run_python_app_command(python_path, app_file, log_file, pid_file)
-    print(f"{app_name} started. PID saved to {pid_file}")
+            # 3. Restart the app automatically if it crashes
+            if _app_supervisor is not None:
+                _app_supervisor.watch(app_dir, pid_dir, log_dir, app_name, wheelhouse_dir=wheelhouse_dir, cgroup_root=cgroup_root, replica=i)
 
 
-def stop_app(pid_dir: str, app_name: str):
+def _is_process_group_leader(process: psutil.Process) -> bool:
+    if platform.system() == "Windows":
+        return False
+    try:
+        return os.getpgid(process.pid) == process.pid
+    except OSError:
+        return False
+
+
+def stop_app(pid_dir: str, app_name: str, timeout: float = 5):
     """
-    Stops an app by killing its process (and children) based on saved PID.
+    Stops an app (all its replicas) and all its children.
+    Apps started in their own process group are sent SIGTERM as a group, and SIGKILL if they
+    have not exited after timeout seconds. Other processes (and their children) are killed directly.
     """
-    pid_file = os.path.join(pid_dir, f"{app_name}_pid.txt")
+    with get_app_lock(app_name):
+        # The app is stopped on purpose, do not restart it
+        if _app_supervisor is not None:
+            _app_supervisor.unwatch(pid_dir, app_name)
 
-    if not os.path.exists(pid_file):
-        print(f"No PID file found for {app_name}")
-        return
+        for instance_name in get_app_instances(pid_dir, app_name) or [app_name]:
+            _stop_app_instance(pid_dir, instance_name, timeout)
 
-    with open(pid_file, "r") as f:
-        pid = int(f.read().strip())
 
+def _stop_app_instance(pid_dir: str, app_name: str, timeout: float):
+    process = process_registry.get(pid_dir, app_name)
+
+    if process is None:
+        print(f"No running process found for {app_name}")
+        process_registry.unregister(pid_dir, app_name)
+        return
+
+    popen = process_registry.get_popen(pid_dir, app_name)
     try:
-        process = psutil.Process(pid)
-        print(f"Stopping {app_name} (PID {pid})...")
-        for child in process.children(recursive=True):
-            child.kill()
-        process.kill()
-        process.wait(timeout=5)
+        print(f"Stopping {app_name} (PID {process.pid})...")
+        if _is_process_group_leader(process):
+            # Children that left the group (e.g. with setsid) are not reached by killpg
+            children = process.children(recursive=True)
+            os.killpg(process.pid, signal.SIGTERM)
+            try:
+                process.wait(timeout=timeout)
+            except psutil.TimeoutExpired:
+                pass
+            # Kill what is left, e.g. children that ignore SIGTERM and outlive the app
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            for child in children:
+                try:
+                    child.kill()
+                except psutil.NoSuchProcess:
+                    pass
+            process.wait(timeout=timeout)
+        else:
+            for child in process.children(recursive=True):
+                child.kill()
+            process.kill()
+            process.wait(timeout=timeout)
         print(f"{app_name} stopped.")
-    except psutil.NoSuchProcess:
-        print(f"Process {pid} not found.")
+    except (psutil.NoSuchProcess, ProcessLookupError):
+        print(f"Process {process.pid} not found.")
     finally:
-        if os.path.exists(pid_file):
-            os.remove(pid_file)
+        if popen is not None:
+            # Reap the child (psutil may already have done so)
+            popen.poll()
+        process_registry.unregister(pid_dir, app_name)
 
 
-def is_app_running(pid_dir: str, app_name: str):
+class AppSupervisor:
     """
-    Checks if app is currently running by verifying PID.
-    Removes PID file if not running.
+    Background loop that watches the processes of apps started with start_app (reaping them through
+    their Popen handle, without reading pid files), and restarts apps that exit without stop_app.
+    Restarts are delayed with exponential backoff. An app that crashes crash_loop_max_restarts times
+    within crash_loop_window seconds is marked as failed and left stopped until it is started again.
     """
-    pid_file = os.path.join(pid_dir, f"{app_name}_pid.txt")
+    RUNNING = "running"
+    BACKOFF = "backoff"
+    RESTARTING = "restarting"
+    FAILED = "failed"
 
-    if not os.path.exists(pid_file):
-        return False
+    def __init__(self, interval: float = 0.5, backoff_initial: float = 1.0, backoff_max: float = 60.0,
+                 crash_loop_max_restarts: int = 5, crash_loop_window: float = 60.0, stable_after: float = 30.0):
+        self.interval = interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.crash_loop_max_restarts = crash_loop_max_restarts
+        self.crash_loop_window = crash_loop_window
+        self.stable_after = stable_after  # seconds of uptime after which the backoff is reset
+        self._apps = {}  # (pid_dir, app_name) -> state dict
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
 
-    with open(pid_file, "r") as f:
-        pid = int(f.read().strip())
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="app-supervisor", daemon=True)
+        self._thread.start()
 
-    if psutil.pid_exists(pid):
-        process = psutil.Process(pid)
-        if process.is_running():
-            return True
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def watch(self, app_dir: str, pid_dir: str, log_dir: str, app_name: str, **start_kwargs):
+        """
+        Supervise a started app (the replica start_kwargs["replica"] of it, if set).
+        Starting an app manually resets its restart history.
+        """
+        instance_name = get_app_instance_name(app_name, start_kwargs.get("replica"))
+        with self._lock:
+            state = self._apps.get((pid_dir, instance_name))
+            if state is not None and state["state"] == AppSupervisor.RESTARTING:
+                state["state"] = AppSupervisor.RUNNING
+                state["started_at"] = time.time()
+                return
+            self._apps[(pid_dir, instance_name)] = {
+                "state": AppSupervisor.RUNNING,
+                "instance_name": instance_name,
+                "start_args": (app_dir, pid_dir, log_dir, app_name),
+                "start_kwargs": start_kwargs,
+                "started_at": time.time(),
+                "restart_count": 0,
+                "consecutive_crashes": 0,
+                "crash_times": [],
+                "last_exit_code": None,
+                "last_exit_at": None,
+                "next_restart_at": None
+            }
+
+    def unwatch(self, pid_dir: str, app_name: str):
+        """Stop supervising an app, and all its replicas."""
+        with self._lock:
+            for key in list(self._apps):
+                if key[0] == pid_dir and get_app_of_instance(key[1]) == app_name:
+                    del self._apps[key]
+
+    @staticmethod
+    def _state_to_status(state: dict) -> dict:
+        return {
+            "state": state["state"],
+            "restart_count": state["restart_count"],
+            "last_exit_code": state["last_exit_code"],
+            "last_exit_at": state["last_exit_at"],
+            "next_restart_at": state["next_restart_at"]
+        }
+
+    def get_status(self, pid_dir: str, app_name: str) -> dict | None:
+        """
+        Supervisor state of the app. For apps with replicas, the state of the replica that is worst off,
+        the total restart count, the latest exit, and the state of each replica under "replicas".
+        """
+        with self._lock:
+            state = self._apps.get((pid_dir, app_name))
+            if state is not None:
+                return self._state_to_status(state)
+            replicas = {
+                key[1]: self._state_to_status(state) for key, state in self._apps.items()
+                if key[0] == pid_dir and get_app_of_instance(key[1]) == app_name
+            }
+        if not replicas:
+            return None
+
+        severity = [AppSupervisor.RUNNING, AppSupervisor.RESTARTING, AppSupervisor.BACKOFF, AppSupervisor.FAILED]
+        statuses = list(replicas.values())
+        last_exit = max(statuses, key=lambda status: status["last_exit_at"] or 0)
+        next_restarts = [status["next_restart_at"] for status in statuses if status["next_restart_at"] is not None]
+        return {
+            "state": max((status["state"] for status in statuses), key=severity.index),
+            "restart_count": sum(status["restart_count"] for status in statuses),
+            "last_exit_code": last_exit["last_exit_code"],
+            "last_exit_at": last_exit["last_exit_at"],
+            "next_restart_at": min(next_restarts) if next_restarts else None,
+            "replicas": replicas
+        }
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print("AppSupervisor", "check failed:", e)
+
+    def _on_exit(self, state: dict, exit_code: int | None, now: float):
+        state["last_exit_code"] = exit_code
+        state["last_exit_at"] = now
+        if state["started_at"] is not None and now - state["started_at"] >= self.stable_after:
+            state["consecutive_crashes"] = 0
+        state["consecutive_crashes"] += 1
+        state["crash_times"] = [t for t in state["crash_times"] if now - t < self.crash_loop_window] + [now]
+
+        app_name = state["instance_name"]
+        if len(state["crash_times"]) >= self.crash_loop_max_restarts:
+            state["state"] = AppSupervisor.FAILED
+            state["next_restart_at"] = None
+            print(f"[supervisor] {app_name} is crash looping ({len(state['crash_times'])} exits within {self.crash_loop_window} s), marked as failed")
+            return
+
+        delay = min(self.backoff_max, self.backoff_initial * 2 ** (state["consecutive_crashes"] - 1))
+        state["state"] = AppSupervisor.BACKOFF
+        state["next_restart_at"] = now + delay
+        print(f"[supervisor] {app_name} exited with code {exit_code}, restarting in {delay:.1f} s")
+
+    def check(self):
+        """Detect exited apps, and restart the ones whose backoff has expired."""
+        now = time.time()
+        to_restart = []
+        with self._lock:
+            for (pid_dir, instance_name), state in self._apps.items():
+                if state["state"] == AppSupervisor.RUNNING:
+                    if process_registry.get(pid_dir, instance_name) is None:
+                        self._on_exit(state, process_registry.get_exit_code(pid_dir, instance_name), now)
+                if state["state"] == AppSupervisor.BACKOFF and now >= state["next_restart_at"]:
+                    state["state"] = AppSupervisor.RESTARTING
+                    state["next_restart_at"] = None
+                    state["restart_count"] += 1
+                    to_restart.append(state)
+
+        # Restart outside the lock, start_app calls watch()
+        for state in to_restart:
+            app_name = state["instance_name"]
+            print(f"[supervisor] restarting {app_name} (restart #{state['restart_count']})")
+            try:
+                with get_app_lock(state["start_args"][3]):
+                    # Skip apps that were stopped while waiting for the lock
+                    with self._lock:
+                        if self._apps.get((state["start_args"][1], app_name)) is not state:
+                            continue
+                    start_app(*state["start_args"], **state["start_kwargs"])
+                with self._lock:
+                    # start_app returns early if the app was started meanwhile
+                    if state["state"] == AppSupervisor.RESTARTING:
+                        state["state"] = AppSupervisor.RUNNING
+                        state["started_at"] = time.time()
+            except Exception as e:
+                print(f"[supervisor] failed to restart {app_name}:", e)
+                with self._lock:
+                    if state["state"] == AppSupervisor.RESTARTING:
+                        self._on_exit(state, None, time.time())
 
-    # Cleanup if process not running
-    os.remove(pid_file)
-    return False
+
+_app_supervisor: AppSupervisor | None = None
+
+
+def start_app_supervisor(**kwargs) -> AppSupervisor:
+    """
+    Start (or return the already running) supervisor. From then on, apps started with start_app
+    are restarted automatically when they exit, see AppSupervisor for the arguments.
+    """
+    global _app_supervisor
+    if _app_supervisor is None:
+        _app_supervisor = AppSupervisor(**kwargs)
+        _app_supervisor.start()
+    return _app_supervisor
+
+
+def stop_app_supervisor():
+    global _app_supervisor
+    if _app_supervisor is not None:
+        _app_supervisor.stop()
+        _app_supervisor = None
+
+
+def get_app_supervisor_status(pid_dir: str, app_name: str) -> dict | None:
+    """
+    Returns the supervisor state of the app, or None if it is not supervised.
+    Example return: {"state": "backoff", "restart_count": 2, "last_exit_code": 1, "last_exit_at": 1700000000.0, "next_restart_at": 1700000004.0}
+    """
+    if _app_supervisor is None:
+        return None
+    return _app_supervisor.get_status(pid_dir, app_name)
+
+
+def is_app_running(pid_dir: str, app_name: str):
+    """
+    Checks if app (any of its replicas) is currently running, using the process registry.
+    Forgets the processes (and removes their PID files) that are not running.
+    """
+    return any(process_registry.get(pid_dir, name) is not None for name in get_app_instances(pid_dir, app_name))
 
 
 def get_app_memory_and_cpu_usage(pid_dir: str, app_name: str):
     """
     Returns CPU and memory usage for the app if running.
+    Uses the latest snapshot from the metrics sampler when one is running for pid_dir,
+    otherwise samples the process directly (blocks for 0.5 s).
     Example return: {"cpu_percent": 3.2, "memory_mb": 124.5}
     """
-    if not is_app_running(pid_dir, app_name):
+    sampler = get_metrics_sampler(pid_dir)
+    if sampler is not None:
+        return sampler.get_app_usage(app_name)
+
+    processes = [process_registry.get(pid_dir, name) for name in get_app_instances(pid_dir, app_name)]
+    processes = [process for process in processes if process is not None]
+    if not processes:
         print("get_app_memory_and_cpu_usage", "app is not running")
         return None
 
-    pid_file = os.path.join(pid_dir, f"{app_name}_pid.txt")
-    with open(pid_file, "r") as f:
-        pid = int(f.read().strip())
+    if len(processes) == 1:
+        cpu = processes[0].cpu_percent(interval=0.5)
+        mem = processes[0].memory_info().rss / (1024 * 1024)  # MB
+        return {"cpu_percent": cpu, "memory_mb": mem}
+
+    for process in processes:
+        process.cpu_percent(interval=None)
+    time.sleep(0.5)
+    return _combine_usage([
+        {"cpu_percent": process.cpu_percent(interval=None), "memory_mb": process.memory_info().rss / (1024 * 1024)}
+        for process in processes
+    ])
+
+
+class MetricsSampler:
+    """
+    Background thread that refreshes CPU and memory usage of all running apps in pid_dir
+    (and of the whole system) every `interval` seconds.
+    psutil.Process handles are reused between ticks, so cpu_percent() can be measured
+    without blocking, and readers only ever get the latest snapshot.
+    Every sample is also added to the usage history (see metrics_util.MetricsHistoryStore).
+    """
+    def __init__(self, pid_dir: str, interval: float = 1.0, history_resolutions=DEFAULT_RESOLUTIONS):
+        self.pid_dir = pid_dir
+        self.interval = interval
+        self.history = MetricsHistoryStore(history_resolutions)
+        self._processes = {}  # app_name -> psutil.Process, handles from the process registry
+        self._app_usage = {}  # app_name -> {"cpu_percent": float, "memory_mb": float}
+        self._system_usage = None
+        self._version = 0  # incremented on every published sample
+        self._lock = threading.Lock()
+        self._updated = threading.Condition(self._lock)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        # Prime the system wide cpu counter, the first non-blocking call always returns 0.0
+        psutil.cpu_percent(interval=None)
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name="metrics-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print("MetricsSampler", "sample failed:", e)
+
+    def sample(self):
+        """Take one sample of every app and of the system, and publish it as the latest snapshot."""
+        instance_usage = {}
+        for instance_name, process in process_registry.running_apps(self.pid_dir).items():
+            try:
+                if self._processes.get(instance_name) is not process:
+                    # New handle, the first non-blocking cpu_percent() call only sets the baseline
+                    process.cpu_percent(interval=None)
+                    self._processes[instance_name] = process
+                with process.oneshot():
+                    cpu = process.cpu_percent(interval=None)
+                    mem = process.memory_info().rss / (1024 * 1024)  # MB
+                instance_usage[instance_name] = {"cpu_percent": cpu, "memory_mb": mem, "started_at": process.create_time()}
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                self._processes.pop(instance_name, None)
 
-    process = psutil.Process(pid)
-    cpu = process.cpu_percent(interval=0.5)
-    mem = process.memory_info().rss / (1024 * 1024)  # MB
-    return {"cpu_percent": cpu, "memory_mb": mem}
+        for instance_name in list(self._processes):
+            if instance_name not in instance_usage:
+                del self._processes[instance_name]
+
+        # Add up the replicas of each app
+        app_usage = {}
+        replica_usage = {}
+        for instance_name, usage in instance_usage.items():
+            app_name = get_app_of_instance(instance_name)
+            if app_name == instance_name:
+                app_usage[app_name] = usage
+            else:
+                replica_usage.setdefault(app_name, []).append(usage)
+        for app_name, usages in replica_usage.items():
+            app_usage[app_name] = _combine_usage(usages)
+
+        system_usage = _get_computer_memory_storage_and_cpu_usage(cpu_interval=None)
+
+        with self._lock:
+            self._app_usage = app_usage
+            self._system_usage = system_usage
+            self._version += 1
+            self._updated.notify_all()
+
+        self.history.record(time.time(), app_usage, system_usage)
+
+    def wait_for_sample(self, after_version: int, timeout: float | None = None) -> int:
+        """
+        Block until a sample newer than after_version has been published (or timeout).
+        Returns the version of the latest sample.
+        """
+        with self._lock:
+            self._updated.wait_for(lambda: self._version > after_version, timeout=timeout)
+            return self._version
+
+    @property
+    def version(self) -> int:
+        """Incremented every time a new sample is published."""
+        with self._lock:
+            return self._version
+
+    def get_app_usage(self, app_name: str):
+        with self._lock:
+            usage = self._app_usage.get(app_name)
+            return dict(usage) if usage is not None else None
+
+    def get_system_usage(self):
+        with self._lock:
+            return dict(self._system_usage) if self._system_usage is not None else None
+
+
+_metrics_sampler: MetricsSampler | None = None
+
+
+def start_metrics_sampler(pid_dir: str, interval: float = 1.0, history_resolutions=DEFAULT_RESOLUTIONS) -> MetricsSampler:
+    """
+    Start (or return the already running) background metrics sampler for pid_dir.
+    Once started, get_app_memory_and_cpu_usage and get_computer_memory_storage_and_cpu_usage
+    return the latest sampled snapshot instead of blocking on psutil.
+    """
+    global _metrics_sampler
+    if _metrics_sampler is not None:
+        if _metrics_sampler.pid_dir == pid_dir:
+            return _metrics_sampler
+        _metrics_sampler.stop()
+    _metrics_sampler = MetricsSampler(pid_dir, interval=interval, history_resolutions=history_resolutions)
+    _metrics_sampler.start()
+    return _metrics_sampler
+
+
+def stop_metrics_sampler():
+    global _metrics_sampler
+    if _metrics_sampler is not None:
+        _metrics_sampler.stop()
+        _metrics_sampler = None
+
+
+def get_metrics_sampler(pid_dir: str | None = None) -> MetricsSampler | None:
+    """Returns the running metrics sampler, or None if there is none (for pid_dir)."""
+    if _metrics_sampler is None:
+        return None
+    if pid_dir is not None and _metrics_sampler.pid_dir != pid_dir:
+        return None
+    return _metrics_sampler
 
 
 def list_installed_apps(app_dir: str):
@@ -143,6 +847,9 @@ def list_installed_apps(app_dir: str):
     directories = []
 
     for entry in os.listdir(app_dir):
+        if entry.startswith("."):
+            # Hidden directories, such as the shared git mirror, are not apps
+            continue
         full_path = os.path.join(app_dir, entry)
         if os.path.isdir(full_path):
             directories.append(entry)
@@ -151,9 +858,179 @@ def list_installed_apps(app_dir: str):
 
     return sorted(directories)
 
+def get_all_apps_status(app_dir: str, pid_dir: str):
+    """
+    Returns running state and usage for every installed app in one pass.
+    Without a metrics sampler all processes share a single 0.5 s cpu measurement window.
+    Example return: [{"app_name": "hello_world", "running": True, "usage": {"cpu_percent": 3.2, "memory_mb": 124.5}}]
+    """
+    apps = list_installed_apps(app_dir)
+    running = {app_name: is_app_running(pid_dir, app_name) for app_name in apps}
+
+    sampler = get_metrics_sampler(pid_dir)
+    if sampler is not None:
+        return [
+            {
+                "app_name": app_name,
+                "running": running[app_name],
+                "usage": sampler.get_app_usage(app_name) if running[app_name] else None,
+                "supervisor": get_app_supervisor_status(pid_dir, app_name)
+            }
+            for app_name in apps
+        ]
+
+    processes = {}  # app_name -> [psutil.Process], one per replica
+    for instance_name, process in process_registry.running_apps(pid_dir).items():
+        app_name = get_app_of_instance(instance_name)
+        if app_name not in running:
+            continue
+        try:
+            process.cpu_percent(interval=None)
+            processes.setdefault(app_name, []).append(process)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+
+    if processes:
+        time.sleep(0.5)
+
+    result = []
+    for app_name in apps:
+        usages = []
+        for process in processes.get(app_name, []):
+            try:
+                with process.oneshot():
+                    usages.append({
+                        "cpu_percent": process.cpu_percent(interval=None),
+                        "memory_mb": process.memory_info().rss / (1024 * 1024)  # MB
+                    })
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        if not usages:
+            usage = None
+        elif len(usages) == 1 and len(processes[app_name]) == 1:
+            usage = usages[0]
+        else:
+            usage = _combine_usage(usages)
+        result.append({
+            "app_name": app_name,
+            "running": running[app_name],
+            "usage": usage,
+            "supervisor": get_app_supervisor_status(pid_dir, app_name)
+        })
+    return result
+
+
+def _usage_changed(previous: dict | None, current: dict | None, thresholds: dict) -> bool:
+    if previous is None or current is None:
+        return previous is not current
+    for key, threshold in thresholds.items():
+        if abs(current.get(key, 0) - previous.get(key, 0)) >= threshold:
+            return True
+    return False
+
+
+def diff_apps_status(previous: dict, current: dict, cpu_threshold: float = 5.0, memory_threshold_mb: float = 10.0) -> dict:
+    """
+    Compare two {app_name: {"running": bool, "usage": dict | None, "supervisor": dict | None}} snapshots.
+    Returns the apps whose running or supervisor state changed, or whose cpu/memory moved by at least
+    the given thresholds. Apps that disappeared are returned with the value None.
+    """
+    thresholds = {"cpu_percent": cpu_threshold, "memory_mb": memory_threshold_mb}
+    changes = {}
+    for app_name, status in current.items():
+        old = previous.get(app_name)
+        if (old is None or old["running"] != status["running"] or old.get("supervisor") != status.get("supervisor")
+                or _usage_changed(old["usage"], status["usage"], thresholds)):
+            changes[app_name] = status
+    for app_name in previous:
+        if app_name not in current:
+            changes[app_name] = None
+    return changes
+
+
+def system_status_changed(previous: dict | None, current: dict | None, percent_threshold: float = 1.0) -> bool:
+    """Returns True if any of the system usage percentages moved by at least percent_threshold."""
+    thresholds = {
+        "cpu_usage_percent": percent_threshold,
+        "memory_usage_percent": percent_threshold,
+        "storage_usage_percent": percent_threshold
+    }
+    return _usage_changed(previous, current, thresholds)
+
+
+_prometheus_metrics_lock = threading.Lock()
+_prometheus_metrics_cache = {"key": None, "text": ""}
+
+
+def get_prometheus_metrics(app_dir: str, pid_dir: str) -> str:
+    """
+    Returns app and system metrics in the Prometheus text exposition format.
+    Built from the metrics sampler snapshot (never measures anything itself), and only rebuilt
+    when the sampler has published a new sample, so scrapes are cheap.
+    """
+    sampler = get_metrics_sampler(pid_dir)
+    if sampler is None:
+        raise RuntimeError("The metrics sampler is not running, see start_metrics_sampler")
+
+    with _prometheus_metrics_lock:
+        key = (app_dir, pid_dir, sampler.version)
+        if _prometheus_metrics_cache["key"] == key:
+            return _prometheus_metrics_cache["text"]
+
+        now = time.time()
+        up = []
+        cpu = []
+        rss = []
+        uptime = []
+        restarts = []
+        for app_name in list_installed_apps(app_dir):
+            labels = {"app": app_name}
+            usage = sampler.get_app_usage(app_name)
+            up.append((labels, 1 if usage is not None else 0))
+            if usage is not None:
+                cpu.append((labels, usage["cpu_percent"]))
+                rss.append((labels, usage["memory_mb"] * 1024 * 1024))
+                uptime.append((labels, max(0.0, now - usage["started_at"])))
+            supervisor = get_app_supervisor_status(pid_dir, app_name)
+            restarts.append((labels, supervisor["restart_count"] if supervisor is not None else 0))
+
+        families = [
+            ("pyappmanager_app_up", "gauge", "Whether the app is running", up),
+            ("pyappmanager_app_cpu_percent", "gauge", "CPU usage of the app in percent of one core", cpu),
+            ("pyappmanager_app_memory_rss_bytes", "gauge", "Resident memory of the app", rss),
+            ("pyappmanager_app_uptime_seconds", "gauge", "Time since the app process was started", uptime),
+            ("pyappmanager_app_restarts_total", "counter", "Restarts of the app by the supervisor", restarts),
+        ]
+        system = sampler.get_system_usage()
+        if system is not None:
+            families += [
+                ("pyappmanager_system_cpu_percent", "gauge", "System wide CPU usage", [({}, system["cpu_usage_percent"])]),
+                ("pyappmanager_system_memory_used_bytes", "gauge", "Used system memory", [({}, system["used_memory_bytes"])]),
+                ("pyappmanager_system_memory_total_bytes", "gauge", "Total system memory", [({}, system["total_memory_bytes"])]),
+                ("pyappmanager_system_disk_used_bytes", "gauge", "Used space on the root filesystem", [({}, system["used_storage_bytes"])]),
+                ("pyappmanager_system_disk_total_bytes", "gauge", "Size of the root filesystem", [({}, system["total_storage_bytes"])]),
+            ]
+
+        text = "".join(format_prometheus_metric(*family) for family in families)
+        _prometheus_metrics_cache["key"] = key
+        _prometheus_metrics_cache["text"] = text
+        return text
+
+
 def get_computer_memory_storage_and_cpu_usage():
+    # Use the latest background sample if available, to avoid blocking for a second
+    sampler = get_metrics_sampler()
+    if sampler is not None:
+        usage = sampler.get_system_usage()
+        if usage is not None:
+            return usage
+
+    return _get_computer_memory_storage_and_cpu_usage(cpu_interval=1)
+
+
+def _get_computer_memory_storage_and_cpu_usage(cpu_interval):
     # CPU usage (percentage)
-    cpu_usage = psutil.cpu_percent(interval=1)
+    cpu_usage = psutil.cpu_percent(interval=cpu_interval)
 
     # Memory usage
     memory = psutil.virtual_memory()
@@ -173,34 +1050,192 @@ def get_computer_memory_storage_and_cpu_usage():
         "storage_usage_percent": disk.percent,
         "total_storage_gb": round(disk.total / (1024 ** 3), 2),
         "used_storage_gb": round(disk.used / (1024 ** 3), 2),
-        "free_storage_gb": round(disk.free / (1024 ** 3), 2)
+        "free_storage_gb": round(disk.free / (1024 ** 3), 2),
+
+        "total_memory_bytes": memory.total,
+        "used_memory_bytes": memory.used,
+        "total_storage_bytes": disk.total,
+        "used_storage_bytes": disk.used
     }
 
 
-def clone_app_from_repo(app_dir: str, repo_url: str, ssh_private_key_path: str, app_name: str):
-    with open(ssh_private_key_path, "r") as file:
-        private_ssh_deploy_key = file.read()
+_mirror_lock = threading.Lock()
+
+
+def get_default_mirror_dir(app_dir: str) -> str:
+    """Where the shared bare mirror is kept when apps are checked out as git worktrees."""
+    return os.path.join(app_dir, ".repo_mirror")
+
+
+def clone_app_from_repo(app_dir: str, repo_url: str, ssh_private_key_path: str, app_name: str, use_worktree: bool = False, mirror_dir: str | None = None, depth: int | None = None, filter_spec: str | None = None):
+    """
+    Clone the branch app_name of repo_url into app_dir/app_name.
+    If use_worktree is set, one bare mirror of the repo is shared by all apps, and each app is a git worktree of it
+    depth and filter_spec (e.g. "blob:none") make a shallow and/or partial clone
+    """
+    with get_app_lock(app_name):
+        with open(ssh_private_key_path, "r") as file:
+            private_ssh_deploy_key = file.read()
     
-    clone_dir = app_dir + "/" + app_name
-    branch = app_name
+        clone_dir = app_dir + "/" + app_name
+        branch = app_name
 
-    if not os.path.exists(clone_dir):
-        clone_repo_using_ssh_key(repo_url, private_ssh_deploy_key, clone_dir, branch)
+        if os.path.exists(clone_dir):
+            return
 
+        if use_worktree:
+            mirror_dir = mirror_dir or get_default_mirror_dir(app_dir)
+            # Apps may be cloned in parallel, but the shared mirror can only be updated by one at a time
+            with _mirror_lock:
+                update_bare_mirror_using_ssh_key(repo_url, private_ssh_deploy_key, mirror_dir, branch, depth=depth, filter_spec=filter_spec)
+                add_worktree_from_mirror(mirror_dir, clone_dir, branch)
+        else:
+            clone_repo_using_ssh_key(repo_url, private_ssh_deploy_key, clone_dir, branch, depth=depth, filter_spec=filter_spec)
 
-def pull_app_from_repo(app_dir: str, ssh_private_key_path: str, app_name: str):
-    with open(ssh_private_key_path, "r") as file:
-        private_ssh_deploy_key = file.read()
+
+def pull_app_from_repo(app_dir: str, ssh_private_key_path: str, app_name: str, depth: int | None = None):
+    with get_app_lock(app_name):
+        with open(ssh_private_key_path, "r") as file:
+            private_ssh_deploy_key = file.read()
     
-    repo_dir = app_dir + "/" + app_name
-    branch = app_name
+        repo_dir = app_dir + "/" + app_name
+        branch = app_name
 
-    if os.path.exists(repo_dir):
-        pull_latest_changes_using_ssh_key(repo_dir, private_ssh_deploy_key, branch)
+        if not os.path.exists(repo_dir):
+            return
+        if os.path.isfile(os.path.join(repo_dir, ".git")):
+            # A worktree fetches into the shared mirror, which can only be updated by one at a time
+            with _mirror_lock:
+                pull_latest_changes_using_ssh_key(repo_dir, private_ssh_deploy_key, branch, depth=depth)
+        else:
+            pull_latest_changes_using_ssh_key(repo_dir, private_ssh_deploy_key, branch, depth=depth)
 
 
 def list_apps_in_repo(repo_url: str, ssh_private_key_path: str):
     with open(ssh_private_key_path, "r") as file:
         private_ssh_deploy_key = file.read()
 
-    return list_branches_using_ssh_key(repo_url=repo_url, deploy_key=private_ssh_deploy_key)
\ No newline at end of file
+    return list_branches_using_ssh_key(repo_url=repo_url, deploy_key=private_ssh_deploy_key)
+
+
+def run_bulk_app_operation(app_names: list[str], operation, max_workers: int | None = None) -> list[dict]:
+    """
+    Run operation(app_name) for every app on a bounded pool of worker threads.
+    Exceptions are caught per app.
+
+    Returns:
+        list: [{"app_name": str, "ok": bool, "error": str | None, "duration_s": float}] in the order of app_names
+    """
+    if max_workers is None:
+        max_workers = min(32, (os.cpu_count() or 1) * 4)
+
+    def run(app_name):
+        started = time.perf_counter()
+        try:
+            operation(app_name)
+            error = None
+        except Exception as e:
+            error = str(e)
+        return {
+            "app_name": app_name,
+            "ok": error is None,
+            "error": error,
+            "duration_s": round(time.perf_counter() - started, 3)
+        }
+
+    if not app_names:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(app_names))), thread_name_prefix="bulk-app") as executor:
+        return list(executor.map(run, app_names))
+
+
+def bulk_clone_apps(app_dir: str, repo_url: str, ssh_private_key_path: str, app_names: list[str], max_workers: int | None = None, **clone_kwargs) -> list[dict]:
+    """Clone several apps in parallel, see clone_app_from_repo and run_bulk_app_operation."""
+    return run_bulk_app_operation(
+        app_names,
+        lambda app_name: clone_app_from_repo(app_dir, repo_url, ssh_private_key_path, app_name, **clone_kwargs),
+        max_workers=max_workers
+    )
+
+
+def bulk_pull_apps(app_dir: str, pid_dir: str, ssh_private_key_path: str, app_names: list[str], max_workers: int | None = None, **pull_kwargs) -> list[dict]:
+    """Stop and pull several apps in parallel, see pull_app_from_repo and run_bulk_app_operation."""
+    def pull(app_name):
+        with get_app_lock(app_name):
+            stop_app(pid_dir, app_name)
+            pull_app_from_repo(app_dir, ssh_private_key_path, app_name, **pull_kwargs)
+    return run_bulk_app_operation(app_names, pull, max_workers=max_workers)
+
+
+def bulk_start_apps(app_dir: str, pid_dir: str, log_dir: str, app_names: list[str], max_workers: int | None = None, **start_kwargs) -> list[dict]:
+    """Start several apps in parallel, see start_app and run_bulk_app_operation."""
+    return run_bulk_app_operation(
+        app_names,
+        lambda app_name: start_app(app_dir, pid_dir, log_dir, app_name, **start_kwargs),
+        max_workers=max_workers
+    )
+
+
+def bulk_stop_apps(pid_dir: str, app_names: list[str], max_workers: int | None = None) -> list[dict]:
+    """Stop several apps in parallel, see stop_app and run_bulk_app_operation."""
+    return run_bulk_app_operation(
+        app_names,
+        lambda app_name: stop_app(pid_dir, app_name),
+        max_workers=max_workers
+    )
+
+
+class RemoteAppsCache:
+    """
+    Caches the branches (apps) of remote repos together with their head SHAs for `ttl` seconds,
+    since every `git ls-remote` is a network round trip.
+    Concurrent lookups of the same repo share one in-flight ls-remote.
+    """
+    def __init__(self, ttl: float = 60):
+        self.ttl = ttl
+        self._entries = {}  # repo_url -> (fetched_at, {branch: sha})
+        self._in_flight = {}  # repo_url -> Future
+        self._lock = threading.Lock()
+
+    def get(self, repo_url: str, ssh_private_key_path: str, refresh: bool = False) -> dict[str, str]:
+        """Returns {branch: head sha} for repo_url, from the cache if it is younger than ttl."""
+        with self._lock:
+            entry = self._entries.get(repo_url)
+            if not refresh and entry is not None and time.monotonic() - entry[0] < self.ttl:
+                return dict(entry[1])
+
+            future = self._in_flight.get(repo_url)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[repo_url] = future
+
+        if not owner:
+            return dict(future.result())
+
+        try:
+            with open(ssh_private_key_path, "r") as file:
+                private_ssh_deploy_key = file.read()
+            heads = list_branch_heads_using_ssh_key(repo_url=repo_url, deploy_key=private_ssh_deploy_key)
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[repo_url]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._entries[repo_url] = (time.monotonic(), heads)
+            del self._in_flight[repo_url]
+        future.set_result(heads)
+        return dict(heads)
+
+    def invalidate(self, repo_url: str | None = None):
+        """Forget the cached branches of repo_url, or of all repos."""
+        with self._lock:
+            if repo_url is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(repo_url, None)
+
+
+remote_apps_cache = RemoteAppsCache()
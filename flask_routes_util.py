@@ -1,8 +1,10 @@
-from flask import Flask, jsonify, request, render_template, Blueprint
+from flask import Flask, jsonify, request, render_template, Blueprint, Response, stream_with_context
 import os
 import sys
 import pathlib
 import re
+import time
+import queue
 from functools import wraps
 
 # Add project paths
@@ -15,14 +17,18 @@ sys.path.append(str(pathlib.Path(__file__).resolve().parents[5]))
 
 from vicmil_pip.lib.pyUtil import *
 from vicmil_pip.lib.pyAppManager.app_manager_util import *
-from vicmil_pip.lib.pyAppManager.nginx_util import NginxConfigBuilder
+from vicmil_pip.lib.pyAppManager.nginx_util import *
+from vicmil_pip.lib.pyAppManager.job_util import JobQueue
+from vicmil_pip.lib.pyAppManager.metrics_util import parse_duration
+from vicmil_pip.lib.pyAppManager.log_util import *
 
 import secrets
 
 import json
+import datetime
 
 
-def setup_app_manager_routes(app, APP_DIR: str, PID_DIR: str, LOG_DIR: str, SSH_KEY_PATH: str, APP_REPO_URL: str, TOKEN_FILE: str, namespace="/", ):
+def setup_app_manager_routes(app, APP_DIR: str, PID_DIR: str, LOG_DIR: str, SSH_KEY_PATH: str, APP_REPO_URL: str, TOKEN_FILE: str, namespace="/", METRICS_SAMPLE_INTERVAL: float = 1.0, STATUS_STREAM_CPU_THRESHOLD: float = 5.0, STATUS_STREAM_MEMORY_THRESHOLD_MB: float = 10.0, USE_GIT_WORKTREES: bool = False, GIT_CLONE_DEPTH: int | None = None, GIT_CLONE_FILTER: str | None = None, REMOTE_APPS_CACHE_TTL: float = 60, BULK_MAX_WORKERS: int | None = None, WHEELHOUSE_DIR: str | None = None, JOB_WORKERS: int = 4, SUPERVISE_APPS: bool = False, LOG_MAX_BYTES: int | None = 10 * 1024 * 1024, LOG_BACKUP_COUNT: int = 5, LOG_INDEX_INTERVAL: float | None = 5.0, CGROUP_ROOT: str | None = None):
     def verify_app_name(app_name):
         """
         Verify that app_name only consists of:
@@ -40,6 +46,10 @@ def setup_app_manager_routes(app, APP_DIR: str, PID_DIR: str, LOG_DIR: str, SSH_
             raise ValueError(
                 "Invalid app name. Only letters, numbers, underscores, and dashes are allowed."
             )
+        if app_name == "bulk":
+            raise ValueError(
+                "Invalid app name. 'bulk' is reserved for bulk operations."
+            )
         
         return True
 
@@ -60,6 +70,30 @@ def setup_app_manager_routes(app, APP_DIR: str, PID_DIR: str, LOG_DIR: str, SSH_
 
     AUTH_TOKEN = load_or_create_token()
 
+    # Sample app and system usage in the background, so status routes never block on psutil
+    metrics_sampler = start_metrics_sampler(PID_DIR, interval=METRICS_SAMPLE_INTERVAL)
+
+    remote_apps_cache.ttl = REMOTE_APPS_CACHE_TTL
+
+    # Restart crashed apps automatically
+    if SUPERVISE_APPS:
+        start_app_supervisor()
+
+    # Bound the disk usage of app logs
+    if LOG_MAX_BYTES:
+        start_log_rotator(LOG_DIR, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT)
+
+    # Record when log lines were written, for searches by time
+    if LOG_INDEX_INTERVAL:
+        start_log_indexer(LOG_DIR, interval=LOG_INDEX_INTERVAL)
+
+    # Clone, pull, start and stop run in the background, the routes return a job id to poll at /jobs/<job_id>.
+    # Jobs of the same app run one at a time, in the order they were requested
+    job_queue = JobQueue(max_workers=JOB_WORKERS)
+
+    def job_response(job, message):
+        return jsonify({"message": message, "job_id": job.id, "status": job.status}), 202
+
     def require_auth(f):
         @wraps(f)
         def decorated(*args, **kwargs):
@@ -96,10 +130,11 @@ def setup_app_manager_routes(app, APP_DIR: str, PID_DIR: str, LOG_DIR: str, SSH_
     def start(app_name):
         try:
             verify_app_name(app_name)
-            print("start app")
-            start_app(APP_DIR, PID_DIR, LOG_DIR, app_name)
-            print(app_name, "started")
-            return jsonify({"message": f"{app_name} started."})
+            job = job_queue.submit(
+                f"start {app_name}", start_app, APP_DIR, PID_DIR, LOG_DIR, app_name,
+                wheelhouse_dir=WHEELHOUSE_DIR, cgroup_root=CGROUP_ROOT, key=f"start:{app_name}", serial_key=app_name
+            )
+            return job_response(job, f"{app_name} start queued.")
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
@@ -108,8 +143,8 @@ def setup_app_manager_routes(app, APP_DIR: str, PID_DIR: str, LOG_DIR: str, SSH_
     def stop(app_name):
         try:
             verify_app_name(app_name)
-            stop_app(PID_DIR, app_name)
-            return jsonify({"message": f"{app_name} stopped."})
+            job = job_queue.submit(f"stop {app_name}", stop_app, PID_DIR, app_name, key=f"stop:{app_name}", serial_key=app_name)
+            return job_response(job, f"{app_name} stop queued.")
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
@@ -119,21 +154,240 @@ def setup_app_manager_routes(app, APP_DIR: str, PID_DIR: str, LOG_DIR: str, SSH_
         verify_app_name(app_name)
         running = is_app_running(PID_DIR, app_name)
         usage = get_app_memory_and_cpu_usage(PID_DIR, app_name) if running else None
-        return jsonify({"app_name": app_name, "running": running, "usage": usage})
+        supervisor = get_app_supervisor_status(PID_DIR, app_name)
+        log_usage = get_log_disk_usage(get_app_log_file(LOG_DIR, app_name))
+        return jsonify({"app_name": app_name, "running": running, "usage": usage, "supervisor": supervisor, "log_usage": log_usage})
+
+    @bp.route("/apps/status", methods=["GET"])
+    @require_auth
+    def status_all():
+        try:
+            return jsonify({"apps": get_all_apps_status(APP_DIR, PID_DIR)})
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    def non_negative_int_arg(name, default):
+        value = int(request.args.get(name, default))
+        if value < 0:
+            raise ValueError(f"'{name}' must not be negative")
+        return value
+
+    @bp.route("/apps/<app_name>/logs", methods=["GET"])
+    @require_auth
+    def app_logs(app_name):
+        """
+        Read the log of an app without loading the whole file:
+        - ?lines=N                 last N lines (default 100)
+        - ?offset=X&length=Y       byte range, a negative offset counts from the end
+        - ?cursor=X[&limit=Y]      complete lines from byte X, continue with the returned next_cursor
+        """
+        try:
+            verify_app_name(app_name)
+            log_file = get_app_log_file(LOG_DIR, app_name)
+            if "cursor" in request.args:
+                cursor = non_negative_int_arg("cursor", 0)
+                limit = max(1, min(non_negative_int_arg("limit", 64 * 1024), 1024 * 1024))
+                return jsonify(read_log_page(log_file, cursor=cursor, max_bytes=limit))
+            if "offset" in request.args:
+                offset = int(request.args["offset"])
+                length = non_negative_int_arg("length", 64 * 1024)
+                return jsonify(read_log_range(log_file, offset=offset, length=length))
+            lines = min(non_negative_int_arg("lines", 100), 10000)
+            return jsonify(tail_log_lines(log_file, lines=lines))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    def parse_time_arg(name):
+        """Unix timestamp or ISO 8601 date (local time if no timezone is given)"""
+        value = request.args.get(name)
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return datetime.datetime.fromisoformat(value).timestamp()
+
+    @bp.route("/apps/<app_name>/logs/search", methods=["GET"])
+    @require_auth
+    def app_logs_search(app_name):
+        """
+        Search the log of an app: ?since=...&until=...&q=keyword&limit=100
+        since and until are unix timestamps or ISO 8601 dates, continue a cut off search with &offset=<next_offset>
+        """
+        try:
+            verify_app_name(app_name)
+            log_file = get_app_log_file(LOG_DIR, app_name)
+            limit = min(non_negative_int_arg("limit", 100), 10000)
+            offset = non_negative_int_arg("offset", 0) if "offset" in request.args else None
+            return jsonify(search_log(
+                log_file,
+                since=parse_time_arg("since"),
+                until=parse_time_arg("until"),
+                query=request.args.get("q") or None,
+                limit=limit,
+                offset=offset
+            ))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @bp.route("/apps/<app_name>/logs/stream", methods=["GET"])
+    @require_auth
+    def app_logs_stream(app_name):
+        """
+        Server-Sent Events stream of the lines appended to the log of an app.
+        Events: "lines" (list of new lines), "truncated" and "rotated" (reading restarted at the beginning of the log)
+        """
+        verify_app_name(app_name)
+        log_file = get_app_log_file(LOG_DIR, app_name)
+        keepalive_interval = 15
+
+        def generate():
+            follower = get_log_follower()
+            subscriber = follower.subscribe(log_file)
+            try:
+                while True:
+                    try:
+                        message = subscriber.get(timeout=keepalive_interval)
+                    except queue.Empty:
+                        # Also detects disconnected viewers, which raise GeneratorExit here
+                        yield ": keepalive\n\n"
+                        continue
+                    data = message.get("lines", [])
+                    yield f"event: {message['event']}\ndata: {json.dumps(data)}\n\n"
+            finally:
+                follower.unsubscribe(log_file, subscriber)
+
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
 
     @bp.route("/system/status", methods=["GET"])
     @require_auth
     def system_status():
         return jsonify(get_computer_memory_storage_and_cpu_usage())
 
+    def parse_metrics_query():
+        window = parse_duration(request.args.get("window", "1h"))
+        points = max(1, min(int(request.args.get("points", 120)), 2000))
+        return window, points
+
+    @bp.route("/apps/<app_name>/metrics", methods=["GET"])
+    @require_auth
+    def app_metrics(app_name):
+        """
+        CPU and memory history of an app: ?window=1h&points=120 (window in s, m, h or d)
+        Each point has the average and maximum of the samples it covers.
+        """
+        try:
+            verify_app_name(app_name)
+            window, points = parse_metrics_query()
+            history = metrics_sampler.history.query_app(app_name, window, points)
+            if history is None:
+                return jsonify({"error": f"No metrics recorded for {app_name}"}), 404
+            return jsonify({"app_name": app_name, **history})
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @bp.route("/system/metrics", methods=["GET"])
+    @require_auth
+    def system_metrics():
+        """CPU and memory history of the system: ?window=1h&points=120"""
+        try:
+            window, points = parse_metrics_query()
+            return jsonify(metrics_sampler.history.query_system(window, points))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @bp.route("/metrics", methods=["GET"])
+    @require_auth
+    def prometheus_metrics():
+        """
+        App and system metrics for Prometheus, scrape with the token as bearer credentials:
+        authorization: {type: Bearer, credentials_file: <TOKEN_FILE>}
+        """
+        try:
+            return Response(get_prometheus_metrics(APP_DIR, PID_DIR), mimetype="text/plain; version=0.0.4")
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @bp.route("/status/stream", methods=["GET"])
+    @require_auth
+    def status_stream():
+        """
+        Server-Sent Events stream of app and system status.
+        The first events contain the full state, after that only changes are pushed:
+        - event "apps": {app_name: status or null if the app was removed}
+        - event "system": full system status
+        """
+        keepalive_interval = 15
+
+        def sse(event, data):
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+        def generate():
+            sampler = start_metrics_sampler(PID_DIR, interval=METRICS_SAMPLE_INTERVAL)
+            sent_apps = {}
+            sent_system = None
+            version = 0
+            last_sent = time.time()
+            while True:
+                version = sampler.wait_for_sample(version, timeout=keepalive_interval)
+                sent_any = False
+
+                try:
+                    apps = {status["app_name"]: status for status in get_all_apps_status(APP_DIR, PID_DIR)}
+                except Exception as e:
+                    print("status_stream", "failed to get app status:", e)
+                    apps = sent_apps
+
+                changes = diff_apps_status(sent_apps, apps, STATUS_STREAM_CPU_THRESHOLD, STATUS_STREAM_MEMORY_THRESHOLD_MB)
+                if changes:
+                    for app_name, status in changes.items():
+                        if status is None:
+                            sent_apps.pop(app_name, None)
+                        else:
+                            sent_apps[app_name] = status
+                    yield sse("apps", changes)
+                    sent_any = True
+
+                system = sampler.get_system_usage()
+                if system_status_changed(sent_system, system):
+                    sent_system = system
+                    yield sse("system", system)
+                    sent_any = True
+
+                if sent_any:
+                    last_sent = time.time()
+                elif time.time() - last_sent >= keepalive_interval:
+                    last_sent = time.time()
+                    yield ": keepalive\n\n"
+
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
     @bp.route("/apps/<app_name>/clone", methods=["POST"])
     @require_auth
     def clone_app(app_name):
         repo_url = APP_REPO_URL
         try:
             verify_app_name(app_name)
-            clone_app_from_repo(APP_DIR, repo_url, SSH_KEY_PATH, app_name)
-            return jsonify({"message": f"{app_name} cloned."})
+
+            def clone():
+                try:
+                    clone_app_from_repo(APP_DIR, repo_url, SSH_KEY_PATH, app_name, use_worktree=USE_GIT_WORKTREES, depth=GIT_CLONE_DEPTH, filter_spec=GIT_CLONE_FILTER)
+                finally:
+                    # The branch heads were just fetched, /remote_apps should not show older ones
+                    remote_apps_cache.invalidate(repo_url)
+
+            job = job_queue.submit(f"clone {app_name}", clone, key=f"clone:{app_name}", serial_key=app_name)
+            return job_response(job, f"{app_name} clone queued.")
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
@@ -142,21 +396,102 @@ def setup_app_manager_routes(app, APP_DIR: str, PID_DIR: str, LOG_DIR: str, SSH_
     def pull_app(app_name):
         try:
             verify_app_name(app_name)
-            stop_app(PID_DIR, app_name)
-            pull_app_from_repo(APP_DIR, SSH_KEY_PATH, app_name)
-            return jsonify({"message": f"{app_name} updated."})
+
+            def pull():
+                try:
+                    with get_app_lock(app_name):
+                        stop_app(PID_DIR, app_name)
+                        pull_app_from_repo(APP_DIR, SSH_KEY_PATH, app_name, depth=GIT_CLONE_DEPTH)
+                finally:
+                    remote_apps_cache.invalidate(APP_REPO_URL)
+
+            job = job_queue.submit(f"pull {app_name}", pull, key=f"pull:{app_name}", serial_key=app_name)
+            return job_response(job, f"{app_name} pull queued.")
         except Exception as e:
             return jsonify({"error": str(e)}), 500
         
+    @bp.route("/apps/bulk/<operation>", methods=["POST"])
+    @require_auth
+    def bulk_operation(operation):
+        """
+        Run clone, pull, start or stop for several apps in parallel, as one background job.
+        JSON body (optional): {"apps": ["app1", "app2"]}
+        Defaults to all installed apps, or for clone to all remote apps that are not installed.
+        The job result contains the per-app results and timings.
+        """
+        try:
+            if operation not in ("clone", "pull", "start", "stop"):
+                return jsonify({"error": f"Unknown bulk operation '{operation}'"}), 404
+
+            body = request.get_json(silent=True) or {}
+            app_names = body.get("apps")
+            if app_names is not None:
+                if not isinstance(app_names, list):
+                    return jsonify({"error": "'apps' must be a list"}), 400
+                for app_name in app_names:
+                    verify_app_name(app_name)
+
+            def run_bulk(app_names):
+                if app_names is None:
+                    if operation == "clone":
+                        installed = set(list_installed_apps(APP_DIR))
+                        app_names = [a for a in remote_apps_cache.get(APP_REPO_URL, SSH_KEY_PATH) if a not in installed]
+                    else:
+                        app_names = list_installed_apps(APP_DIR)
+
+                started = time.perf_counter()
+                if operation == "clone":
+                    results = bulk_clone_apps(APP_DIR, APP_REPO_URL, SSH_KEY_PATH, app_names, max_workers=BULK_MAX_WORKERS, use_worktree=USE_GIT_WORKTREES, depth=GIT_CLONE_DEPTH, filter_spec=GIT_CLONE_FILTER)
+                    remote_apps_cache.invalidate(APP_REPO_URL)
+                elif operation == "pull":
+                    results = bulk_pull_apps(APP_DIR, PID_DIR, SSH_KEY_PATH, app_names, max_workers=BULK_MAX_WORKERS, depth=GIT_CLONE_DEPTH)
+                    remote_apps_cache.invalidate(APP_REPO_URL)
+                elif operation == "start":
+                    results = bulk_start_apps(APP_DIR, PID_DIR, LOG_DIR, app_names, max_workers=BULK_MAX_WORKERS, wheelhouse_dir=WHEELHOUSE_DIR, cgroup_root=CGROUP_ROOT)
+                else:
+                    results = bulk_stop_apps(PID_DIR, app_names, max_workers=BULK_MAX_WORKERS)
+
+                return {
+                    "operation": operation,
+                    "results": results,
+                    "ok": all(r["ok"] for r in results),
+                    "duration_s": round(time.perf_counter() - started, 3)
+                }
+
+            job = job_queue.submit(f"bulk {operation}", run_bulk, app_names, key=f"bulk:{operation}")
+            return job_response(job, f"Bulk {operation} queued.")
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @bp.route("/jobs", methods=["GET"])
+    @require_auth
+    def list_jobs():
+        jobs = [job.to_dict() for job in job_queue.list_jobs()]
+        for job in jobs:
+            del job["output"]
+        return jsonify({"jobs": jobs})
+
+    @bp.route("/jobs/<job_id>", methods=["GET"])
+    @require_auth
+    def get_job(job_id):
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({"error": f"Job {job_id} not found"}), 404
+        return jsonify(job.to_dict())
+
     @bp.route("/remote_apps", methods=["GET"])
     @require_auth
     def remote_apps():
         """
         List branches (apps) from the hard-coded remote repo.
+        The result is cached until a clone or pull finishes, pass ?refresh=1 to bypass the cache.
         """
         try:
-            apps = list_apps_in_repo(APP_REPO_URL, SSH_KEY_PATH)
-            return jsonify({"remote_apps": apps})
+            refresh = request.args.get("refresh", "0").lower() in ("1", "true", "yes")
+            heads = remote_apps_cache.get(APP_REPO_URL, SSH_KEY_PATH, refresh=refresh)
+            return jsonify({"remote_apps": list(heads), "heads": heads})
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
@@ -260,7 +595,9 @@ def setup_nginx_manager_routes(app, conf_file_path: str, local_conf_json_path: s
     def update_conf():
         """
         Update the configuration JSON file.
-        Ensures all routes use ports in the 10000–15000 range.
+        Ensures all routes (and all their replicas, on consecutive ports) use ports in the 10000–15000 range.
+        Route types: "proxy" (default, "websocket": true for websockets), "proxy_cache" and "static",
+        and optional top level "compression" and "tls" objects, see NginxServer.set_compression and set_tls
         """
         try:
             new_conf = request.get_json(force=True)
@@ -274,11 +611,93 @@ def setup_nginx_manager_routes(app, conf_file_path: str, local_conf_json_path: s
         if not isinstance(routes, list):
             return jsonify({"error": "'routes' must be a list"}), 400
 
+        def is_int(value, minimum):
+            return isinstance(value, int) and not isinstance(value, bool) and value >= minimum
+
+        def is_time(value):
+            return re.fullmatch(r"\d+(ms|s|m|h|d)?", str(value)) is not None
+
+        def is_directive_value(value):
+            """No whitespace, quotes, braces or semicolons, which could end the nginx directive"""
+            return isinstance(value, str) and re.fullmatch(r"[^\s;{}\"'\\]+", value) is not None
+
+        compression = new_conf.get("compression")
+        if compression is not None:
+            if not isinstance(compression, dict):
+                return jsonify({"error": "'compression' must be an object"}), 400
+            unknown = set(compression) - {"gzip", "brotli", "level", "min_length", "types"}
+            if unknown:
+                return jsonify({"error": f"compression: unknown settings {', '.join(sorted(unknown))}"}), 400
+            for key in ("gzip", "brotli"):
+                if key in compression and not isinstance(compression[key], bool):
+                    return jsonify({"error": f"compression: '{key}' must be a boolean"}), 400
+            if "level" in compression and not (is_int(compression["level"], 1) and compression["level"] <= 11):
+                return jsonify({"error": "compression: 'level' must be an integer from 1 to 11"}), 400
+            if "min_length" in compression and not is_int(compression["min_length"], 0):
+                return jsonify({"error": "compression: 'min_length' must be a non-negative integer"}), 400
+            if "types" in compression and not (isinstance(compression["types"], list) and all(re.fullmatch(r"[\w.+-]+/[\w.+-]+", str(t)) for t in compression["types"])):
+                return jsonify({"error": "compression: 'types' must be a list of mime types"}), 400
+
+        tls = new_conf.get("tls")
+        if tls is not None:
+            if not isinstance(tls, dict):
+                return jsonify({"error": "'tls' must be an object"}), 400
+            unknown = set(tls) - set(DEFAULT_TLS)
+            if unknown:
+                return jsonify({"error": f"tls: unknown settings {', '.join(sorted(unknown))}"}), 400
+            for key in ("http2", "session_tickets", "stapling"):
+                if key in tls and not isinstance(tls[key], bool):
+                    return jsonify({"error": f"tls: '{key}' must be a boolean"}), 400
+            if "preset" in tls and tls["preset"] not in TLS_PRESETS:
+                return jsonify({"error": f"tls: 'preset' must be one of {', '.join(TLS_PRESETS)}"}), 400
+            if tls.get("session_cache") is not None and not re.fullmatch(r"off|none|shared:\w+:\d+[kKmM]?", str(tls["session_cache"])):
+                return jsonify({"error": "tls: 'session_cache' must be like shared:SSL:10m, off or none"}), 400
+            if "session_timeout" in tls and not is_time(tls["session_timeout"]):
+                return jsonify({"error": "tls: 'session_timeout' must be a time like 1d"}), 400
+            if tls.get("protocols") is not None and not re.fullmatch(r"TLSv1(\.[123])?( TLSv1(\.[123])?)*", str(tls["protocols"])):
+                return jsonify({"error": "tls: 'protocols' must be like 'TLSv1.2 TLSv1.3'"}), 400
+            if tls.get("ciphers") is not None and not re.fullmatch(r"[A-Za-z0-9_:+!@=-]+", str(tls["ciphers"])):
+                return jsonify({"error": "tls: invalid 'ciphers'"}), 400
+            if tls.get("trusted_certificate") is not None and not (is_directive_value(tls["trusted_certificate"]) and os.path.isabs(tls["trusted_certificate"])):
+                return jsonify({"error": "tls: 'trusted_certificate' must be an absolute path"}), 400
+            if tls.get("resolver") is not None and not re.fullmatch(r"[\w.:\[\]-]+( [\w.:\[\]-]+)*", str(tls["resolver"])):
+                return jsonify({"error": "tls: invalid 'resolver'"}), 400
+            # ssl_stapling_verify needs the CA chain, and nginx needs a resolver to reach the OCSP responder
+            if tls.get("stapling") and not (tls.get("resolver") and tls.get("trusted_certificate")):
+                return jsonify({"error": "tls: 'stapling' needs 'resolver' and 'trusted_certificate'"}), 400
+
         # Validate each route
         for i, route in enumerate(routes):
             if not isinstance(route, dict):
                 return jsonify({"error": f"Route #{i+1} must be an object"}), 400
 
+            if not route.get("route"):
+                return jsonify({"error": f"Route #{i+1}: Missing 'route' value"}), 400
+
+            route_type = route.get("type", "proxy")
+            if route_type not in ("proxy", "proxy_cache", "static"):
+                return jsonify({"error": f"Route #{i+1}: 'type' must be proxy, proxy_cache or static"}), 400
+
+            if route_type == "static":
+                path = route.get("path")
+                if not is_directive_value(path) or not os.path.isabs(path):
+                    return jsonify({"error": f"Route #{i+1}: 'path' must be an absolute path"}), 400
+                if "alias" in route and not isinstance(route["alias"], bool):
+                    return jsonify({"error": f"Route #{i+1}: 'alias' must be a boolean"}), 400
+                if route.get("expires") is not None and not (is_time(route["expires"]) or route["expires"] in ("off", "epoch", "max")):
+                    return jsonify({"error": f"Route #{i+1}: 'expires' must be a time like 7d, or off, epoch or max"}), 400
+                continue
+
+            if route_type == "proxy_cache":
+                if not re.fullmatch(r"[A-Za-z0-9_]+", str(route.get("cache_zone", ""))):
+                    return jsonify({"error": f"Route #{i+1}: 'cache_zone' must be a name of letters, digits and underscores"}), 400
+                if "cache_ttl" in route and not is_time(route["cache_ttl"]):
+                    return jsonify({"error": f"Route #{i+1}: 'cache_ttl' must be a time like 10m"}), 400
+                if "cache_key" in route and not is_directive_value(route["cache_key"]):
+                    return jsonify({"error": f"Route #{i+1}: Invalid 'cache_key'"}), 400
+                if "cache_max_size" in route and not re.fullmatch(r"\d+[kKmMgG]?", str(route["cache_max_size"])):
+                    return jsonify({"error": f"Route #{i+1}: 'cache_max_size' must be a size like 1g or 500m"}), 400
+
             port = route.get("port")
             if not isinstance(port, int):
                 return jsonify({"error": f"Route #{i+1}: 'port' must be an integer"}), 400
@@ -286,12 +705,24 @@ def setup_nginx_manager_routes(app, conf_file_path: str, local_conf_json_path: s
             if not (10000 <= port <= 15000):
                 return jsonify({"error": f"Route #{i+1}: Port {port} out of allowed range (10000–15000)"}), 400
 
-            if not route.get("route"):
-                return jsonify({"error": f"Route #{i+1}: Missing 'route' value"}), 400
-
             if "websocket" in route and not isinstance(route["websocket"], bool):
                 return jsonify({"error": f"Route #{i+1}: 'websocket' must be a boolean"}), 400
 
+            replicas = route.get("replicas", 1)
+            if not is_int(replicas, 1):
+                return jsonify({"error": f"Route #{i+1}: 'replicas' must be a positive integer"}), 400
+
+            last_port = port + replicas - 1
+            if last_port > 15000:
+                return jsonify({"error": f"Route #{i+1}: Replica ports {port}–{last_port} out of allowed range (10000–15000)"}), 400
+
+            for key, minimum in (("keepalive", 0), ("keepalive_requests", 1)):
+                if key in route and not is_int(route[key], minimum):
+                    return jsonify({"error": f"Route #{i+1}: '{key}' must be an integer >= {minimum}"}), 400
+
+            if "keepalive_timeout" in route and not is_time(route["keepalive_timeout"]):
+                return jsonify({"error": f"Route #{i+1}: 'keepalive_timeout' must be a time like 60s or 5m"}), 400
+
         # Save config
         try:
             os.makedirs(os.path.dirname(local_conf_json_path), exist_ok=True)
@@ -333,19 +764,46 @@ def setup_nginx_manager_routes(app, conf_file_path: str, local_conf_json_path: s
                 ssl_key=ssl_key
             )
 
+            if conf_data.get("compression"):
+                server.set_compression(**conf_data["compression"])
+            if conf_data.get("tls"):
+                server.set_tls(**conf_data["tls"])
+
             # Add routes
             for entry in routes:
                 route = entry.get("route", "/")
+                route_type = entry.get("type", "proxy")
                 port = entry.get("port")
                 websocket = entry.get("websocket", False)
+                replicas = entry.get("replicas", 1)
+
+                if route_type == "static":
+                    server.add_static_location(
+                        route, entry["path"], alias=entry.get("alias", True),
+                        expires=entry.get("expires", DEFAULT_STATIC_EXPIRES)
+                    )
+                    continue
 
                 if port is None:
                     return jsonify({"error": f"Route {route} missing port"}), 400
 
-                if websocket:
-                    server.add_websocket_location(route, port)
+                keepalive_settings = {
+                    "keepalive": entry.get("keepalive", DEFAULT_KEEPALIVE),
+                    "keepalive_timeout": str(entry.get("keepalive_timeout", DEFAULT_KEEPALIVE_TIMEOUT)),
+                    "keepalive_requests": entry.get("keepalive_requests", DEFAULT_KEEPALIVE_REQUESTS)
+                }
+                if route_type == "proxy_cache":
+                    server.add_cached_proxy_location(
+                        route, port, cache_zone=entry["cache_zone"],
+                        cache_ttl=str(entry.get("cache_ttl", DEFAULT_CACHE_TTL)),
+                        cache_key=entry.get("cache_key", DEFAULT_CACHE_KEY),
+                        cache_max_size=str(entry.get("cache_max_size", DEFAULT_CACHE_MAX_SIZE)),
+                        replicas=replicas, **keepalive_settings
+                    )
+                elif websocket:
+                    server.add_websocket_location(route, port, replicas=replicas)
                 else:
-                    server.add_proxy_location(route, port)
+                    server.add_proxy_location(route, port, replicas=replicas, **keepalive_settings)
 
             # Generate + Save + Reload
             builder.save_to_file(conf_file_path)
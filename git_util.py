@@ -1,71 +1,195 @@
 import os
 import subprocess
 import tempfile
+import shutil
+import hashlib
+import threading
+import atexit
+from vicmil_pip.lib.pyAppManager.job_util import run_subprocess
 
-def clone_repo_using_ssh_key(repo_url: str, deploy_key: str, clone_dir: str = "./cloned_repo", branch: str | None = None):
-    """Clone a private Git repository using a deploy key without relying on any existing SSH keys."""
-    with tempfile.TemporaryDirectory() as tmpdir:
-        key_path = os.path.join(tmpdir, "id_rsa")
 
-        # Write the deploy key to a temporary file
-        with open(key_path, "w") as f:
+class GitSSHTransport:
+    """
+    Writes a deploy key once to a private temporary directory, and provides an environment
+    for git that only uses this key, ignoring SSH agent or default keys.
+    With multiplexing enabled, ssh keeps one authenticated master connection per host open for
+    control_persist seconds (ControlMaster/ControlPersist), so a burst of git operations
+    (list, clone, pull of many apps) pays for a single handshake.
+    """
+    def __init__(self, deploy_key: str, multiplex: bool | None = None, control_persist: int = 120):
+        if multiplex is None:
+            # Windows OpenSSH does not support ControlMaster
+            multiplex = os.name != "nt"
+
+        # mkdtemp creates the directory readable by the current user only
+        self._dir = tempfile.mkdtemp(prefix="git-ssh-")
+        self.key_path = os.path.join(self._dir, "id_key")
+        fd = os.open(self.key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
             f.write(deploy_key)
-        os.chmod(key_path, 0o600)
 
-        # Use GIT_SSH_COMMAND to ensure ONLY this key is used, ignoring SSH agent or default keys
-        env = os.environ.copy()
-        env["GIT_SSH_COMMAND"] = (
-            f"ssh -i {key_path} -o IdentitiesOnly=yes -o StrictHostKeyChecking=no"
-        )
+        ssh_command = f'ssh -i "{self.key_path}" -o IdentitiesOnly=yes -o StrictHostKeyChecking=no'
+        self.multiplex = multiplex
+        if multiplex:
+            # %C is a hash of the connection, which keeps the socket path short
+            control_path = os.path.join(self._dir, "cm-%C")
+            ssh_command += f' -o ControlMaster=auto -o "ControlPath={control_path}" -o ControlPersist={control_persist}'
 
-        # Build git clone command
-        cmd = ["git", "clone", "--single-branch"]
-        if branch:
-            cmd += ["--branch", branch]
-        cmd += [repo_url, clone_dir]
+        self.env = os.environ.copy()
+        self.env["GIT_SSH_COMMAND"] = ssh_command
+
+    def close(self):
+        """Stop the master connections, and remove the key."""
+        if not os.path.isdir(self._dir):
+            return
+        for entry in os.listdir(self._dir):
+            if entry.startswith("cm-"):
+                subprocess.run(
+                    ["ssh", "-o", f"ControlPath={os.path.join(self._dir, entry)}", "-O", "exit", "git-ssh-transport"],
+                    capture_output=True
+                )
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+_transports = {}  # sha256 of deploy key -> GitSSHTransport
+_transports_lock = threading.Lock()
+
+
+def get_git_ssh_transport(deploy_key: str) -> GitSSHTransport:
+    """Returns a shared transport for the deploy key, so its ssh connections are reused between git operations."""
+    key_hash = hashlib.sha256(deploy_key.encode("utf-8")).hexdigest()
+    with _transports_lock:
+        transport = _transports.get(key_hash)
+        if transport is None:
+            transport = GitSSHTransport(deploy_key)
+            _transports[key_hash] = transport
+        return transport
+
+
+def close_git_ssh_transports():
+    """Close all shared transports (called automatically at exit)."""
+    with _transports_lock:
+        for transport in _transports.values():
+            transport.close()
+        _transports.clear()
 
-        # Run git clone
-        subprocess.run(cmd, check=True, env=env)
+
+atexit.register(close_git_ssh_transports)
+
+
+def clone_repo_using_ssh_key(repo_url: str, deploy_key: str, clone_dir: str = "./cloned_repo", branch: str | None = None, depth: int | None = None, filter_spec: str | None = None):
+    """
+    Clone a private Git repository using a deploy key without relying on any existing SSH keys.
+
+    Args:
+        depth: Only fetch the last `depth` commits (shallow clone)
+        filter_spec: Partial clone filter, e.g. "blob:none" to download file contents on demand
+    """
+    env = get_git_ssh_transport(deploy_key).env
+
+    # Build git clone command
+    cmd = ["git", "clone", "--single-branch"]
+    if branch:
+        cmd += ["--branch", branch]
+    if depth:
+        cmd += ["--depth", str(depth)]
+    if filter_spec:
+        cmd += [f"--filter={filter_spec}"]
+    cmd += [repo_url, clone_dir]
+
+    # Run git clone
+    run_subprocess(cmd, env=env)
 
     print(f"✅ Repository cloned to: {clone_dir}")
     if branch:
         print(f"🌿 Checked out branch: {branch}")
 
 
-def pull_latest_changes_using_ssh_key(repo_dir: str, deploy_key: str, branch: str | None = None):
+def pull_latest_changes_using_ssh_key(repo_dir: str, deploy_key: str, branch: str | None = None, depth: int | None = None):
     """
     Pull the latest changes from a Git repository directory using the deploy key,
     without relying on any existing SSH keys or agents.
+    Only the refspec of the branch is fetched. A partial clone filter set at clone time is kept by git.
+
+    Args:
+        depth: Only fetch the last `depth` commits (keeps a shallow clone shallow),
+               the checkout is then moved to the fetched commit instead of merged
     """
-    if not os.path.isdir(os.path.join(repo_dir, ".git")):
+    # .git is a file (not a directory) in worktrees
+    if not os.path.exists(os.path.join(repo_dir, ".git")):
         raise FileNotFoundError(f"{repo_dir} is not a valid Git repository.")
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        key_path = os.path.join(tmpdir, "id_rsa")
+    env = get_git_ssh_transport(deploy_key).env
 
-        # Write the deploy key to a temporary file
-        with open(key_path, "w") as f:
-            f.write(deploy_key)
-        os.chmod(key_path, 0o600)
-
-        # Use GIT_SSH_COMMAND to ensure ONLY this key is used
-        env = os.environ.copy()
-        env["GIT_SSH_COMMAND"] = (
-            f"ssh -i {key_path} -o IdentitiesOnly=yes -o StrictHostKeyChecking=no"
-        )
-
-        # Fetch and pull the latest changes
-        subprocess.run(["git", "-C", repo_dir, "fetch", "--all"], check=True, env=env)
+    if depth:
+        # A shallow fetch cuts the history, so the new commit cannot be merged, move the checkout to it instead.
+        # --keep refuses to overwrite local changes
+        cmd = ["git", "-C", repo_dir, "fetch", "--depth", str(depth), "origin"]
         if branch:
-            subprocess.run(["git", "-C", repo_dir, "pull", "origin", branch], check=True, env=env)
-        else:
-            subprocess.run(["git", "-C", repo_dir, "pull"], check=True, env=env)
+            cmd += [branch]
+        run_subprocess(cmd, env=env)
+        run_subprocess(["git", "-C", repo_dir, "reset", "--keep", "FETCH_HEAD"], env=env)
+    else:
+        # Pull fetches the branch itself, fetching all remotes first would fetch everything twice
+        cmd = ["git", "-C", repo_dir, "pull"]
+        if branch:
+            cmd += ["origin", branch]
+        run_subprocess(cmd, env=env)
 
     print(f"🔄 Pulled latest changes in: {repo_dir}")
     if branch:
         print(f"🌿 Updated branch: {branch}")
 
 
+def update_bare_mirror_using_ssh_key(repo_url: str, deploy_key: str, mirror_dir: str, branch: str | None = None, depth: int | None = None, filter_spec: str | None = None):
+    """
+    Create a local bare clone of the repository (shared by all worktrees), or fetch into it if it exists.
+    Remote branches are kept as refs/remotes/origin/<branch>, so branches checked out in worktrees are never overwritten by a fetch.
+    depth and filter_spec work as in clone_repo_using_ssh_key.
+    """
+    env = get_git_ssh_transport(deploy_key).env
+
+    if not os.path.exists(mirror_dir):
+        cmd = ["git", "clone", "--bare"]
+        if depth:
+            cmd += ["--depth", str(depth)]
+        if filter_spec:
+            cmd += [f"--filter={filter_spec}"]
+        run_subprocess(cmd + [repo_url, mirror_dir], env=env)
+        run_subprocess(["git", "-C", mirror_dir, "config", "remote.origin.fetch", "+refs/heads/*:refs/remotes/origin/*"])
+
+    # Only fetch the branch that is needed
+    cmd = ["git", "-C", mirror_dir, "fetch", "--prune"]
+    if depth:
+        cmd += ["--depth", str(depth)]
+    cmd += ["origin"]
+    if branch:
+        cmd += [f"+refs/heads/{branch}:refs/remotes/origin/{branch}"]
+    run_subprocess(cmd, env=env)
+
+    print(f"🪞 Mirror updated in: {mirror_dir}")
+
+
+def add_worktree_from_mirror(mirror_dir: str, worktree_dir: str, branch: str):
+    """
+    Check out a branch of a bare mirror (see update_bare_mirror_using_ssh_key) as a new worktree.
+    The worktree shares the object database of the mirror, so this only costs a checkout.
+    """
+    # Forget worktrees whose directories have been deleted
+    run_subprocess(["git", "-C", mirror_dir, "worktree", "prune"])
+    run_subprocess(["git", "-C", mirror_dir, "worktree", "add", "-B", branch, os.path.abspath(worktree_dir), f"origin/{branch}"])
+    run_subprocess(["git", "-C", worktree_dir, "branch", f"--set-upstream-to=origin/{branch}"])
+
+    print(f"🌳 Worktree created in: {worktree_dir}")
+    print(f"🌿 Checked out branch: {branch}")
+
+
 def list_branches_using_ssh_key(repo_url: str, deploy_key: str) -> list[str]:
     """
     List all remote branches of a Git repository using the deploy key,
@@ -78,35 +202,35 @@ def list_branches_using_ssh_key(repo_url: str, deploy_key: str) -> list[str]:
     Returns:
         List of branch names (strings)
     """
-    with tempfile.TemporaryDirectory() as tmpdir:
-        key_path = os.path.join(tmpdir, "id_rsa")
+    return list(list_branch_heads_using_ssh_key(repo_url, deploy_key))
 
-        # Write deploy key
-        with open(key_path, "w") as f:
-            f.write(deploy_key)
-        os.chmod(key_path, 0o600)
-
-        # Set SSH command
-        env = os.environ.copy()
-        env["GIT_SSH_COMMAND"] = (
-            f"ssh -i {key_path} -o IdentitiesOnly=yes -o StrictHostKeyChecking=no"
-        )
-
-        # List remote branches directly
-        result = subprocess.run(
-            ["git", "ls-remote", "--heads", repo_url],
-            check=True,
-            capture_output=True,
-            text=True,
-            env=env,
-        )
-
-        branches = [
-            line.split("\t")[1].replace("refs/heads/", "")
-            for line in result.stdout.strip().splitlines()
-            if line
-        ]
-        return branches
+
+def list_branch_heads_using_ssh_key(repo_url: str, deploy_key: str) -> dict[str, str]:
+    """
+    List all remote branches of a Git repository together with the commit SHA of their heads,
+    using the deploy key without relying on any existing SSH keys or agents.
+
+    Returns:
+        dict: {branch name: head commit SHA}
+    """
+    env = get_git_ssh_transport(deploy_key).env
+
+    # List remote branches directly
+    result = subprocess.run(
+        ["git", "ls-remote", "--heads", repo_url],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+
+    heads = {}
+    for line in result.stdout.strip().splitlines():
+        if not line:
+            continue
+        sha, ref = line.split("\t")
+        heads[ref.replace("refs/heads/", "")] = sha
+    return heads
 
 
 from cryptography.hazmat.primitives.asymmetric import ed25519
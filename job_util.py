@@ -0,0 +1,217 @@
+import sys
+import subprocess
+import threading
+import time
+import uuid
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _ThreadOutputRouter:
+    """
+    Replacement for sys.stdout that also copies everything printed by a job's thread into that job.
+    Output of other threads is passed through unchanged.
+    """
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def set_job(self, job):
+        self._local.job = job
+
+    def write(self, data):
+        job = getattr(self._local, "job", None)
+        if job is not None:
+            job.append_output(data)
+        return self._stream.write(data)
+
+    def flush(self):
+        return self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+_output_router = None
+_output_router_lock = threading.Lock()
+
+
+def _get_output_router() -> _ThreadOutputRouter:
+    global _output_router
+    with _output_router_lock:
+        if _output_router is None:
+            _output_router = _ThreadOutputRouter(sys.stdout)
+            sys.stdout = _output_router
+        return _output_router
+
+
+def run_subprocess(cmd: list[str], check: bool = True, **kwargs) -> subprocess.CompletedProcess:
+    """
+    Like subprocess.run(cmd, check=True), but the output (stdout and stderr) of the command is printed as it is
+    written, so it ends up in the output of the job running it (e.g. why a git fetch or pip install failed).
+    The tail of the output is also kept as stdout of the result, and as output of the CalledProcessError.
+    """
+    tail = deque(maxlen=200)
+    with subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          text=True, errors="replace", **kwargs) as process:
+        for line in process.stdout:
+            print(line, end="")
+            tail.append(line)
+    output = "".join(tail)
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, output=output)
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout=output)
+
+
+class Job:
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    def __init__(self, name: str, key: str | None = None, max_output_chars: int = 65536):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.key = key
+        self.status = Job.QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.max_output_chars = max_output_chars
+        self._output = []
+        self._output_chars = 0
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (Job.SUCCEEDED, Job.FAILED)
+
+    def append_output(self, data: str):
+        with self._lock:
+            self._output.append(data)
+            self._output_chars += len(data)
+            # Only keep the tail of the output
+            while self._output_chars > self.max_output_chars and len(self._output) > 1:
+                self._output_chars -= len(self._output.pop(0))
+
+    def get_output(self) -> str:
+        with self._lock:
+            return "".join(self._output)
+
+    def to_dict(self) -> dict:
+        if self.started_at is None:
+            duration = None
+        else:
+            duration = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            "job_id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration_s": duration,
+            "output": self.get_output(),
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class JobQueue:
+    """
+    Runs slow operations (clone, pull, start, ...) on a background thread pool.
+    Jobs can be polled by id, and expose their status, printed output, duration and result.
+    A job submitted with the same key as a queued or running job is not started again,
+    the existing job is returned instead.
+    Jobs with the same serial_key (e.g. the app they operate on) run one at a time, in the order they were submitted.
+    """
+    def __init__(self, max_workers: int = 4, max_finished_jobs: int = 200):
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}  # job_id -> Job, in submit order
+        self._active_keys = {}  # key -> Job
+        self._serial_running = {}  # serial_key -> Job that is running (or handed to the pool)
+        self._serial_waiting = {}  # serial_key -> deque of (job, func, args, kwargs) to run after it
+        self._lock = threading.Lock()
+        self._output_router = _get_output_router()
+
+    def submit(self, name: str, func, *args, key: str | None = None, serial_key: str | None = None, **kwargs) -> Job:
+        """
+        Queue func(*args, **kwargs) and return its Job, or the active job with the same key.
+        An active job is only reused if no other job with the same serial_key was submitted after it,
+        e.g. start, stop, start runs all three.
+        """
+        with self._lock:
+            waiting = self._serial_waiting.get(serial_key)
+            last = waiting[-1][0] if waiting else self._serial_running.get(serial_key)
+            active = self._active_keys.get(key) if key is not None else None
+            if active is not None and (serial_key is None or last is active):
+                return active
+            job = Job(name, key=key)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._active_keys[key] = job
+            self._forget_old_jobs()
+
+            # Jobs waiting for another job of their serial_key do not take a worker, they are queued
+            # here, and handed to the pool when the job before them finishes
+            if serial_key is not None:
+                if serial_key in self._serial_running:
+                    self._serial_waiting.setdefault(serial_key, deque()).append((job, func, args, kwargs))
+                    return job
+                self._serial_running[serial_key] = job
+
+        self._executor.submit(self._run, job, func, args, kwargs, serial_key)
+        return job
+
+    def _run(self, job: Job, func, args, kwargs, serial_key: str | None = None):
+        job.status = Job.RUNNING
+        job.started_at = time.time()
+        self._output_router.set_job(job)
+        try:
+            job.result = func(*args, **kwargs)
+            job.status = Job.SUCCEEDED
+        except Exception as e:
+            job.error = str(e)
+            output = getattr(e, "output", None)
+            if isinstance(output, str) and output.strip():
+                # Add what a failed command (see run_subprocess) said went wrong, e.g. "fatal: ..." of git
+                lines = output.strip().splitlines()
+                errors = [line for line in lines if line.lower().startswith(("fatal:", "error:"))]
+                job.error += ": " + (errors or lines)[-1]
+            job.append_output(traceback.format_exc())
+            job.status = Job.FAILED
+        finally:
+            self._output_router.set_job(None)
+            job.finished_at = time.time()
+            next_job = None
+            with self._lock:
+                if job.key is not None and self._active_keys.get(job.key) is job:
+                    del self._active_keys[job.key]
+                if serial_key is not None:
+                    waiting = self._serial_waiting.get(serial_key)
+                    if waiting:
+                        next_job = waiting.popleft()
+                        self._serial_running[serial_key] = next_job[0]
+                        if not waiting:
+                            del self._serial_waiting[serial_key]
+                    else:
+                        del self._serial_running[serial_key]
+            if next_job is not None:
+                self._executor.submit(self._run, *next_job, serial_key)
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> list[Job]:
+        with self._lock:
+            return list(self._jobs.values())
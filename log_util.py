@@ -0,0 +1,639 @@
+import os
+import gzip
+import shutil
+import threading
+import queue
+import select
+import ctypes
+import platform
+import time
+import bisect
+from concurrent.futures import ThreadPoolExecutor
+
+
+def get_app_log_file(log_dir: str, app_name: str) -> str:
+    return os.path.join(log_dir, f"{app_name}.log")
+
+
+def _archived_segment_path(log_file: str, index: int) -> str:
+    return f"{log_file}.{index}.gz"
+
+
+def get_log_index_file(log_file: str) -> str:
+    return log_file + ".idx"
+
+
+# Held while a log is truncated and while its index is updated, so an index entry never
+# records an offset of the log from before the truncation
+_log_index_lock = threading.Lock()
+
+
+def compress_log_segment(segment_file: str):
+    """Compress segment_file to segment_file.gz, and remove the uncompressed file."""
+    tmp_file = segment_file + ".gz.tmp"
+    with open(segment_file, "rb") as src, gzip.open(tmp_file, "wb") as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(tmp_file, segment_file + ".gz")
+    os.remove(segment_file)
+
+
+def rotate_log_file(log_file: str, backup_count: int = 5) -> str | None:
+    """
+    Rotate a log file that app processes keep open in append mode (copy-truncate):
+    - Archived segments are shifted, <log>.1.gz -> <log>.2.gz ..., and the oldest are removed
+    - The current content is copied to <log>.1, and the log file is truncated in place
+    Processes writing with O_APPEND continue at the new end of the file, so they do not have to reopen it.
+    Lines written between the end of the copy and the truncation are lost, keep the window short by
+    compressing the copy afterwards (see compress_log_segment).
+
+    Returns:
+        str | None: Path of the uncompressed segment to compress, or None if there was nothing to rotate
+    """
+    if not os.path.exists(log_file) or os.path.getsize(log_file) == 0:
+        return None
+
+    segment_file = f"{log_file}.1"
+    if os.path.exists(segment_file):
+        # The previous segment was never compressed
+        compress_log_segment(segment_file)
+
+    # Shift archived segments
+    for index in range(backup_count, 0, -1):
+        segment = _archived_segment_path(log_file, index)
+        if not os.path.exists(segment):
+            continue
+        if index >= backup_count:
+            os.remove(segment)
+        else:
+            os.replace(segment, _archived_segment_path(log_file, index + 1))
+
+    with open(log_file, "rb") as src, open(segment_file, "wb") as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+        with _log_index_lock:
+            os.truncate(log_file, 0)
+            # The offsets in the index referred to the old content
+            if os.path.exists(get_log_index_file(log_file)):
+                os.truncate(get_log_index_file(log_file), 0)
+
+    if backup_count < 1:
+        os.remove(segment_file)
+        return None
+    return segment_file
+
+
+def get_log_disk_usage(log_file: str) -> dict:
+    """
+    Returns the disk usage of a log file and its archived segments.
+    Example return: {"log_bytes": 1024, "archived_bytes": 2048, "archived_segments": 2, "total_bytes": 3072}
+    """
+    log_bytes = os.path.getsize(log_file) if os.path.exists(log_file) else 0
+    archived_bytes = 0
+    archived_segments = 0
+    log_dir = os.path.dirname(log_file) or "."
+    prefix = os.path.basename(log_file) + "."
+    if os.path.isdir(log_dir):
+        for entry in os.listdir(log_dir):
+            if entry.startswith(prefix) and (entry.endswith(".gz") or entry[len(prefix):].isdigit()):
+                archived_bytes += os.path.getsize(os.path.join(log_dir, entry))
+                archived_segments += 1
+    return {
+        "log_bytes": log_bytes,
+        "archived_bytes": archived_bytes,
+        "archived_segments": archived_segments,
+        "total_bytes": log_bytes + archived_bytes
+    }
+
+
+def tail_log_lines(log_file: str, lines: int = 100, chunk_size: int = 64 * 1024, max_bytes: int = 4 * 1024 * 1024) -> dict:
+    """
+    Returns the last `lines` lines of a log file, reading backwards from the end in chunks,
+    so memory use does not depend on the size of the file (at most max_bytes are read).
+    Example return: {"lines": ["..."], "start_offset": 1000, "end_offset": 1200}
+    """
+    if not os.path.exists(log_file):
+        return {"lines": [], "start_offset": 0, "end_offset": 0}
+
+    with open(log_file, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        pos = size
+        data = b""
+        # One newline more than lines is needed to know that the first line is complete
+        while pos > 0 and data.count(b"\n") <= lines and len(data) < max_bytes:
+            read_size = min(chunk_size, pos)
+            pos -= read_size
+            f.seek(pos)
+            data = f.read(read_size) + data
+
+    # The first part is only known to be a complete line if a newline was found before it
+    body = data[:-1] if data.endswith(b"\n") else data
+    parts = body.split(b"\n") if body else []
+    selected = parts[-lines:] if lines > 0 else []
+    if pos > 0 and len(selected) == len(parts) and selected:
+        selected = selected[1:]
+
+    selected_bytes = len(b"\n".join(selected)) + (len(data) - len(body)) if selected else 0
+    return {
+        "lines": [line.decode("utf-8", errors="replace") for line in selected],
+        "start_offset": size - selected_bytes,
+        "end_offset": size
+    }
+
+
+def read_log_range(log_file: str, offset: int, length: int, max_length: int = 1024 * 1024) -> dict:
+    """
+    Returns up to `length` bytes (at most max_length) of a log file, starting at byte `offset`.
+    A negative offset is counted from the end of the file.
+    Example return: {"data": "...", "offset": 0, "next_offset": 1024, "size": 4096}
+    """
+    size = os.path.getsize(log_file) if os.path.exists(log_file) else 0
+    if offset < 0:
+        offset = max(0, size + offset)
+    offset = min(offset, size)
+    length = max(0, min(length, max_length, size - offset))
+
+    data = b""
+    if length > 0:
+        with open(log_file, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+    return {
+        "data": data.decode("utf-8", errors="replace"),
+        "offset": offset,
+        "next_offset": offset + len(data),
+        "size": size
+    }
+
+
+def read_log_page(log_file: str, cursor: int = 0, max_bytes: int = 64 * 1024) -> dict:
+    """
+    Cursor based pagination over the complete lines of a log file.
+    Pass the returned next_cursor to get the next page. If the log was truncated (e.g. rotated)
+    since the cursor was returned, reading restarts at the beginning and "reset" is True.
+    A single line longer than max_bytes is returned in pieces.
+    Example return: {"lines": ["..."], "cursor": 0, "next_cursor": 2048, "size": 4096, "eof": False, "reset": False}
+    """
+    size = os.path.getsize(log_file) if os.path.exists(log_file) else 0
+    reset = cursor > size
+    if reset or cursor < 0:
+        cursor = 0
+    max_bytes = max(1, max_bytes)
+
+    data = b""
+    if cursor < size:
+        with open(log_file, "rb") as f:
+            f.seek(cursor)
+            data = f.read(min(max_bytes, size - cursor))
+        # Only return complete lines, the rest is returned on the next page
+        last_newline = data.rfind(b"\n")
+        if last_newline != -1:
+            data = data[:last_newline + 1]
+        elif len(data) < max_bytes:
+            # A partial last line, possibly still being written
+            data = b""
+
+    next_cursor = cursor + len(data)
+    return {
+        "lines": data.decode("utf-8", errors="replace").splitlines(),
+        "cursor": cursor,
+        "next_cursor": next_cursor,
+        "size": size,
+        "eof": next_cursor >= size,
+        "reset": reset
+    }
+
+
+def _read_last_index_entry(index_file: str) -> tuple[float, int] | None:
+    try:
+        with open(index_file, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - 128))
+            lines = f.read().split(b"\n")
+    except FileNotFoundError:
+        return None
+    for line in reversed(lines):
+        parts = line.split()
+        if len(parts) == 2:
+            return float(parts[0]), int(parts[1])
+    return None
+
+
+def update_log_index(log_file: str, timestamp: float | None = None) -> bool:
+    """
+    Append "<timestamp> <offset>" to the index of log_file (<log>.idx) if the log grew since the last entry.
+    An entry means that every byte before offset was written at or before timestamp,
+    and every byte after it was written after timestamp.
+    Returns True if an entry was added.
+    """
+    with _log_index_lock:
+        if not os.path.exists(log_file):
+            return False
+        size = os.path.getsize(log_file)
+        index_file = get_log_index_file(log_file)
+        last_entry = _read_last_index_entry(index_file)
+        if last_entry is not None and last_entry[1] == size:
+            return False
+        if last_entry is not None and last_entry[1] > size:
+            # Truncated by something else than the rotator, the old entries are meaningless
+            os.truncate(index_file, 0)
+        if timestamp is None:
+            timestamp = time.time()
+        with open(index_file, "a") as f:
+            f.write(f"{timestamp:.3f} {size}\n")
+        return True
+
+
+def load_log_index(log_file: str) -> tuple[list[float], list[int]]:
+    """Returns the (timestamps, offsets) of the index of log_file, both sorted ascending."""
+    timestamps = []
+    offsets = []
+    try:
+        with open(get_log_index_file(log_file), "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) != 2:
+                    continue
+                timestamps.append(float(parts[0]))
+                offsets.append(int(parts[1]))
+    except FileNotFoundError:
+        pass
+    return timestamps, offsets
+
+
+def search_log(log_file: str, since: float | None = None, until: float | None = None, query: str | None = None, limit: int = 100, offset: int | None = None, max_scan_bytes: int = 16 * 1024 * 1024) -> dict:
+    """
+    Returns the lines of log_file written between since and until (unix timestamps) that contain query.
+    The index (see update_log_index) is used to only read the part of the file in the time range,
+    without an index the whole file is searched. Timestamps are when the manager saw the line,
+    so they are only accurate to the interval of the indexer.
+    At most limit lines are returned, and at most max_scan_bytes are read. If the search was cut off,
+    pass next_offset as offset to continue.
+
+    Example return:
+    {"matches": [{"offset": 120, "time": 1700000000.0, "line": "..."}], "start_offset": 0, "end_offset": 4096, "next_offset": None}
+    "time" is the index timestamp at or before which the line was written (None if not indexed yet)
+    """
+    size = os.path.getsize(log_file) if os.path.exists(log_file) else 0
+    timestamps, offsets = load_log_index(log_file)
+
+    start = 0
+    end = size
+    if since is not None:
+        # Everything before the last entry at or before since was written before since
+        i = bisect.bisect_right(timestamps, since) - 1
+        if i >= 0:
+            start = offsets[i]
+    if until is not None:
+        # Everything after the first entry at or after until was written after until
+        i = bisect.bisect_left(timestamps, until)
+        if i < len(timestamps):
+            end = offsets[i]
+    end = min(end, size)
+    start = min(start, end)
+    if offset is not None:
+        start = max(start, min(offset, end))
+
+    matches = []
+    position = start
+    if start >= end:
+        return {"matches": matches, "start_offset": start, "end_offset": end, "next_offset": None}
+
+    query_bytes = query.encode("utf-8") if query else None
+    with open(log_file, "rb") as f:
+        # Start at a line boundary
+        if position > 0:
+            f.seek(position - 1)
+            if f.read(1) != b"\n":
+                f.readline()
+            position = f.tell()
+        scan_end = min(end, position + max_scan_bytes)
+        while position < scan_end and len(matches) < limit:
+            line = f.readline()
+            if not line:
+                break
+            line_offset = position
+            position += len(line)
+            if query_bytes is not None and query_bytes not in line:
+                continue
+            i = bisect.bisect_right(offsets, line_offset)
+            matches.append({
+                "offset": line_offset,
+                "time": timestamps[i] if i < len(timestamps) else None,
+                "line": line.rstrip(b"\n").decode("utf-8", errors="replace")
+            })
+
+    return {
+        "matches": matches,
+        "start_offset": start,
+        "end_offset": end,
+        "next_offset": position if position < end else None
+    }
+
+
+class LogIndexer:
+    """
+    Background thread that appends a timestamp/offset entry to the index of every *.log file in log_dir
+    that grew in the last interval seconds, so searches by time can seek to the right part of the log.
+    The index stays small: at most one entry per log per interval, and only while the app is logging.
+    """
+    def __init__(self, log_dir: str, interval: float = 5.0):
+        self.log_dir = log_dir
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="log-indexer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                print("LogIndexer", "check failed:", e)
+            self._stop_event.wait(self.interval)
+
+    def check(self):
+        if not os.path.isdir(self.log_dir):
+            return
+        now = time.time()
+        for entry in os.listdir(self.log_dir):
+            if entry.endswith(".log"):
+                update_log_index(os.path.join(self.log_dir, entry), timestamp=now)
+
+
+_log_indexer: LogIndexer | None = None
+
+
+def start_log_indexer(log_dir: str, interval: float = 5.0) -> LogIndexer:
+    """Start (or return the already running) log indexer for log_dir."""
+    global _log_indexer
+    if _log_indexer is not None:
+        if _log_indexer.log_dir == log_dir:
+            return _log_indexer
+        _log_indexer.stop()
+    _log_indexer = LogIndexer(log_dir, interval=interval)
+    _log_indexer.start()
+    return _log_indexer
+
+
+class LogRotator:
+    """
+    Background thread that rotates every *.log file in log_dir once it grows beyond max_bytes,
+    keeping at most backup_count gzip compressed segments per log.
+    Compression runs on a separate worker thread, so rotation (copy + truncate) stays fast.
+    Disk usage per log is bounded by about max_bytes * (1 + backup_count).
+    """
+    def __init__(self, log_dir: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5, interval: float = 10.0):
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.interval = interval
+        self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-compress")
+        self._pending = {}  # log_file -> Future of the compression of its last segment
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="log-rotator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                print("LogRotator", "check failed:", e)
+            self._stop_event.wait(self.interval)
+
+    def check(self):
+        """Rotate the logs that are too large."""
+        if not os.path.isdir(self.log_dir):
+            return
+        for entry in os.listdir(self.log_dir):
+            path = os.path.join(self.log_dir, entry)
+            if entry.endswith(".log"):
+                if os.path.getsize(path) >= self.max_bytes:
+                    self.rotate(path)
+            elif entry.endswith(".log.1"):
+                # Segment left uncompressed, e.g. by a restart of the manager
+                pending = self._pending.get(path[:-2])
+                if pending is None or pending.done():
+                    self._pending[path[:-2]] = self._compressor.submit(compress_log_segment, path)
+
+    def rotate(self, log_file: str):
+        # The previous segment must be compressed before segments are shifted again
+        pending = self._pending.pop(log_file, None)
+        if pending is not None:
+            pending.result()
+        segment_file = rotate_log_file(log_file, backup_count=self.backup_count)
+        if segment_file is not None:
+            self._pending[log_file] = self._compressor.submit(compress_log_segment, segment_file)
+
+
+_log_rotator: LogRotator | None = None
+
+
+def start_log_rotator(log_dir: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5, interval: float = 10.0) -> LogRotator:
+    """Start (or return the already running) log rotator for log_dir."""
+    global _log_rotator
+    if _log_rotator is not None:
+        if _log_rotator.log_dir == log_dir:
+            return _log_rotator
+        _log_rotator.stop()
+    _log_rotator = LogRotator(log_dir, max_bytes=max_bytes, backup_count=backup_count, interval=interval)
+    _log_rotator.start()
+    return _log_rotator
+
+
+class _Inotify:
+    """Minimal ctypes binding of Linux inotify, only used to wake up when something in a directory changes."""
+    IN_MODIFY = 0x00000002
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    DIRECTORY_MASK = IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watched = set()
+
+    def watch_directory(self, path: str):
+        if path in self._watched:
+            return
+        if self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.DIRECTORY_MASK) < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self._watched.add(path)
+
+    def wait(self, timeout: float) -> bool:
+        """Block until an event arrives (True) or timeout (False). The events themselves are discarded."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LogFollower:
+    """
+    Follows log files and pushes new lines to subscriber queues.
+    A single thread serves all followed files and all viewers: it sleeps until inotify reports a change in
+    one of the log directories (or polls every poll_interval seconds where inotify is unavailable),
+    reads the new bytes once and fans the complete lines out to every subscriber.
+    Rotation (a new file) and truncation (copy-truncate) restart reading at the beginning of the file.
+
+    Subscriber queues receive dicts: {"event": "lines", "lines": [...]}, {"event": "truncated"} or {"event": "rotated"}
+    """
+    def __init__(self, poll_interval: float = 1.0, max_read_bytes: int = 1024 * 1024, max_queue_size: int = 1000):
+        self.poll_interval = poll_interval
+        self.max_read_bytes = max_read_bytes
+        self.max_queue_size = max_queue_size
+        self._files = {}  # log_file -> {"position": int, "inode": int | None, "partial": bytes, "subscribers": set}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._inotify = None
+        if platform.system() == "Linux":
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError) as e:
+                print("LogFollower", "inotify unavailable, polling instead:", e)
+
+    def subscribe(self, log_file: str) -> queue.Queue:
+        """Start receiving lines appended to log_file from now on."""
+        subscriber = queue.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            state = self._files.get(log_file)
+            if state is None:
+                exists = os.path.exists(log_file)
+                state = {
+                    "position": os.path.getsize(log_file) if exists else 0,
+                    "inode": os.stat(log_file).st_ino if exists else None,
+                    "partial": b"",
+                    "subscribers": set()
+                }
+                self._files[log_file] = state
+                if self._inotify is not None:
+                    log_dir = os.path.dirname(os.path.abspath(log_file))
+                    os.makedirs(log_dir, exist_ok=True)
+                    self._inotify.watch_directory(log_dir)
+            state["subscribers"].add(subscriber)
+
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="log-follower", daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, log_file: str, subscriber: queue.Queue):
+        with self._lock:
+            state = self._files.get(log_file)
+            if state is None:
+                return
+            state["subscribers"].discard(subscriber)
+            if not state["subscribers"]:
+                del self._files[log_file]
+
+    def _run(self):
+        more = False
+        while True:
+            # Keep reading without waiting while a file has more than max_read_bytes of new data
+            if not more:
+                if self._inotify is not None:
+                    self._inotify.wait(self.poll_interval)
+                else:
+                    time.sleep(self.poll_interval)
+            more = False
+            with self._lock:
+                for log_file, state in list(self._files.items()):
+                    try:
+                        more = self._read_new(log_file, state) or more
+                    except OSError as e:
+                        print("LogFollower", f"failed to read {log_file}:", e)
+
+    def _publish(self, state: dict, message: dict):
+        for subscriber in state["subscribers"]:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # The viewer is not keeping up, drop the message rather than block everyone else
+                pass
+
+    def _read_new(self, log_file: str, state: dict) -> bool:
+        """Publish the new complete lines of log_file. Returns True if there is more data left to read."""
+        try:
+            stat = os.stat(log_file)
+        except FileNotFoundError:
+            return False
+
+        if state["inode"] is not None and stat.st_ino != state["inode"]:
+            state["position"] = 0
+            state["partial"] = b""
+            self._publish(state, {"event": "rotated"})
+        elif stat.st_size < state["position"]:
+            state["position"] = 0
+            state["partial"] = b""
+            self._publish(state, {"event": "truncated"})
+        state["inode"] = stat.st_ino
+
+        if stat.st_size == state["position"]:
+            return False
+
+        with open(log_file, "rb") as f:
+            f.seek(state["position"])
+            data = f.read(min(stat.st_size - state["position"], self.max_read_bytes))
+        state["position"] += len(data)
+        more = state["position"] < stat.st_size
+
+        data = state["partial"] + data
+        last_newline = data.rfind(b"\n")
+        if last_newline == -1:
+            # Do not buffer a single unterminated line forever
+            if len(data) < self.max_read_bytes:
+                state["partial"] = data
+                return more
+            last_newline = len(data)
+        state["partial"] = data[last_newline + 1:]
+        lines = data[:last_newline].decode("utf-8", errors="replace").split("\n")
+        self._publish(state, {"event": "lines", "lines": lines})
+        return more
+
+
+_log_follower: LogFollower | None = None
+_log_follower_lock = threading.Lock()
+
+
+def get_log_follower() -> LogFollower:
+    """Returns the log follower shared by all viewers."""
+    global _log_follower
+    with _log_follower_lock:
+        if _log_follower is None:
+            _log_follower = LogFollower()
+        return _log_follower
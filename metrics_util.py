@@ -0,0 +1,211 @@
+import threading
+import math
+import re
+import time
+from array import array
+
+
+# (seconds per sample, number of samples): 1 s for an hour, 1 min for a week
+DEFAULT_RESOLUTIONS = ((1, 3600), (60, 7 * 24 * 60))
+
+
+def parse_duration(value: str) -> float:
+    """Parse "90", "90s", "15m", "1h" or "7d" into seconds."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", value)
+    if match is None:
+        raise ValueError(f"Invalid duration: {value}")
+    return float(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+
+
+def _escape_prometheus_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_prometheus_metric(name: str, metric_type: str, help_text: str, samples: list) -> str:
+    """
+    Format one metric family in the Prometheus text exposition format.
+    samples is a list of (labels dict, value), e.g. [({"app": "hello_world"}, 1)]
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        if labels:
+            label_text = ",".join(f'{key}="{_escape_prometheus_label(val)}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {float(value)!r}")
+        else:
+            lines.append(f"{name} {float(value)!r}")
+    return "\n".join(lines) + "\n"
+
+
+class _RingSeries:
+    """
+    Fixed size ring buffer of samples, backed by arrays so memory use does not grow.
+    Every sample has a timestamp and an average and maximum per field.
+    """
+    def __init__(self, fields: tuple, step: float, capacity: int):
+        self.fields = fields
+        self.step = step
+        self.capacity = capacity
+        self.timestamps = array("d", [0.0] * capacity)
+        self.avg = {field: array("f", [0.0] * capacity) for field in fields}
+        self.max = {field: array("f", [0.0] * capacity) for field in fields}
+        self.head = 0  # Index the next sample is written to
+        self.count = 0
+
+        # Samples of the bucket that is still being filled
+        self._bucket = None
+        self._bucket_count = 0
+        self._bucket_sum = dict.fromkeys(fields, 0.0)
+        self._bucket_max = dict.fromkeys(fields, 0.0)
+
+    @property
+    def span(self) -> float:
+        return self.step * self.capacity
+
+    def add(self, timestamp: float, values: dict):
+        bucket = math.floor(timestamp / self.step)
+        if self._bucket is not None and bucket != self._bucket:
+            self._flush()
+        self._bucket = bucket
+        self._bucket_count += 1
+        for field in self.fields:
+            value = values.get(field, 0.0)
+            self._bucket_sum[field] += value
+            if self._bucket_count == 1 or value > self._bucket_max[field]:
+                self._bucket_max[field] = value
+
+    def _flush(self):
+        i = self.head
+        self.timestamps[i] = self._bucket * self.step
+        for field in self.fields:
+            self.avg[field][i] = self._bucket_sum[field] / self._bucket_count
+            self.max[field][i] = self._bucket_max[field]
+            self._bucket_sum[field] = 0.0
+        self._bucket_count = 0
+        self.head = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def last_timestamp(self) -> float | None:
+        if self._bucket is not None:
+            return self._bucket * self.step
+        return None
+
+    def query(self, since: float, until: float, points: int) -> dict:
+        """Samples between since and until, downsampled to at most `points` evenly spaced buckets."""
+        width = max(self.step, (until - since) / max(1, points))
+        n = max(1, math.ceil((until - since) / width))
+        counts = [0] * n
+        sums = {field: [0.0] * n for field in self.fields}
+        maxes = {field: [None] * n for field in self.fields}
+
+        def add_sample(t, avg, max_):
+            if t < since or t >= until:
+                return
+            b = min(n - 1, int((t - since) / width))
+            counts[b] += 1
+            for field in self.fields:
+                sums[field][b] += avg[field]
+                if maxes[field][b] is None or max_[field] > maxes[field][b]:
+                    maxes[field][b] = max_[field]
+
+        start = (self.head - self.count) % self.capacity
+        for k in range(self.count):
+            i = (start + k) % self.capacity
+            add_sample(
+                self.timestamps[i],
+                {field: self.avg[field][i] for field in self.fields},
+                {field: self.max[field][i] for field in self.fields}
+            )
+        # Include the bucket that is still being filled, so the latest samples are not missing
+        if self._bucket_count:
+            add_sample(
+                self._bucket * self.step,
+                {field: self._bucket_sum[field] / self._bucket_count for field in self.fields},
+                self._bucket_max
+            )
+
+        # Empty buckets (e.g. while an app was stopped) are returned as None
+        series = {}
+        for field in self.fields:
+            series[field] = {
+                "avg": [round(sums[field][b] / counts[b], 3) if counts[b] else None for b in range(n)],
+                "max": [round(maxes[field][b], 3) if counts[b] else None for b in range(n)]
+            }
+        return {
+            "resolution_s": self.step,
+            "timestamps": [round(since + b * width, 3) for b in range(n)],
+            "series": series
+        }
+
+
+class MetricsHistory:
+    """
+    History of a set of metrics (e.g. cpu_percent and memory_mb of one app) at several resolutions.
+    Every resolution is a fixed size ring buffer, so memory use stays the same however long it runs.
+    """
+    def __init__(self, fields: tuple, resolutions=DEFAULT_RESOLUTIONS):
+        self.fields = tuple(fields)
+        self.tiers = [_RingSeries(self.fields, step, capacity) for step, capacity in sorted(resolutions)]
+
+    def add(self, timestamp: float, values: dict):
+        for tier in self.tiers:
+            tier.add(timestamp, values)
+
+    def last_timestamp(self) -> float | None:
+        return self.tiers[0].last_timestamp()
+
+    @property
+    def span(self) -> float:
+        return max(tier.span for tier in self.tiers)
+
+    def query(self, window: float, points: int = 120, now: float | None = None) -> dict:
+        """
+        Returns the last `window` seconds, downsampled to at most `points` buckets,
+        from the finest resolution that covers the whole window.
+        Example return:
+        {"window_s": 3600, "resolution_s": 1, "timestamps": [...], "series": {"cpu_percent": {"avg": [...], "max": [...]}}}
+        """
+        if now is None:
+            now = time.time()
+        tier = next((tier for tier in self.tiers if tier.span >= window), self.tiers[-1])
+        window = min(window, tier.span)
+        result = tier.query(now - window, now, points)
+        result["window_s"] = window
+        return result
+
+
+APP_METRICS_FIELDS = ("cpu_percent", "memory_mb")
+SYSTEM_METRICS_FIELDS = ("cpu_usage_percent", "memory_usage_percent", "used_memory_gb")
+
+
+class MetricsHistoryStore:
+    """History of every app and of the system, fed by the metrics sampler."""
+    def __init__(self, resolutions=DEFAULT_RESOLUTIONS):
+        self.resolutions = resolutions
+        self._apps = {}  # app_name -> MetricsHistory
+        self._system = MetricsHistory(SYSTEM_METRICS_FIELDS, resolutions)
+        self._lock = threading.Lock()
+
+    def record(self, timestamp: float, app_usage: dict, system_usage: dict | None):
+        with self._lock:
+            for app_name, usage in app_usage.items():
+                history = self._apps.get(app_name)
+                if history is None:
+                    history = self._apps[app_name] = MetricsHistory(APP_METRICS_FIELDS, self.resolutions)
+                history.add(timestamp, usage)
+            if system_usage is not None:
+                self._system.add(timestamp, system_usage)
+
+            # Forget apps that have not run for longer than the history reaches back
+            for app_name in list(self._apps):
+                history = self._apps[app_name]
+                if app_name not in app_usage and timestamp - history.last_timestamp() > history.span:
+                    del self._apps[app_name]
+
+    def query_app(self, app_name: str, window: float, points: int = 120) -> dict | None:
+        with self._lock:
+            history = self._apps.get(app_name)
+            return history.query(window, points) if history is not None else None
+
+    def query_system(self, window: float, points: int = 120) -> dict:
+        with self._lock:
+            return self._system.query(window, points)
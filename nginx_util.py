@@ -1,7 +1,52 @@
 import os
+import re
 import subprocess
 import json
 
+# Connection pool to the backend of proxy locations, see the keepalive* directives of ngx_http_upstream_module
+DEFAULT_KEEPALIVE = 16  # Idle connections kept open per nginx worker, 0 disables the pool
+DEFAULT_KEEPALIVE_TIMEOUT = "60s"
+DEFAULT_KEEPALIVE_REQUESTS = 1000
+
+DEFAULT_STATIC_EXPIRES = "7d"
+DEFAULT_CACHE_TTL = "10m"
+DEFAULT_CACHE_KEY = "$scheme$host$request_uri"
+DEFAULT_CACHE_MAX_SIZE = "1g"
+DEFAULT_CACHE_DIR = "/var/cache/nginx"
+
+DEFAULT_COMPRESSION_TYPES = [
+    "text/plain", "text/css", "text/xml", "text/javascript", "application/javascript",
+    "application/json", "application/xml", "application/rss+xml", "image/svg+xml"
+]
+
+# TLS protocol/cipher presets, from the Mozilla server side TLS guidelines
+TLS_PRESETS = {
+    "modern": {
+        "protocols": "TLSv1.3",
+        "ciphers": None,
+    },
+    "intermediate": {
+        "protocols": "TLSv1.2 TLSv1.3",
+        "ciphers": "ECDHE-ECDSA-AES128-GCM-SHA256:ECDHE-RSA-AES128-GCM-SHA256:ECDHE-ECDSA-AES256-GCM-SHA384:"
+                   "ECDHE-RSA-AES256-GCM-SHA384:ECDHE-ECDSA-CHACHA20-POLY1305:ECDHE-RSA-CHACHA20-POLY1305:"
+                   "DHE-RSA-AES128-GCM-SHA256:DHE-RSA-AES256-GCM-SHA384",
+    },
+}
+
+DEFAULT_TLS = {
+    "http2": True,
+    "session_cache": "shared:SSL:10m",  # about 40000 sessions
+    "session_timeout": "1d",
+    "session_tickets": False,  # Tickets need key rotation to keep forward secrecy, the session cache resumes sessions instead
+    "preset": "intermediate",
+    "protocols": None,  # Overrides the protocols of the preset
+    "ciphers": None,  # Overrides the ciphers of the preset
+    "stapling": False,
+    "trusted_certificate": None,  # CA chain to verify stapled OCSP responses
+    "resolver": None,  # DNS servers to reach the OCSP responder, e.g. "1.1.1.1 8.8.8.8"
+}
+
+
 class NginxConfigBuilder:
     def __init__(self):
         self.servers = []
@@ -66,27 +111,217 @@ class NginxServer:
         self.ssl_cert = ssl_cert
         self.ssl_key = ssl_key
         self.locations = {}  # key = route, value = dict with type and config
+        self.compression = None  # see set_compression
+        self.tls = dict(DEFAULT_TLS)  # see set_tls, only used with ssl_cert and ssl_key
 
     # --- Location Adders ---
-    def add_proxy_location(self, route: str, port: int):
-        """Add a standard HTTP proxy location."""
-        self.locations[route] = {"type": "proxy", "port": port, "websocket": False}
+    def add_proxy_location(self, route: str, port: int, replicas: int = 1, keepalive: int = DEFAULT_KEEPALIVE,
+                           keepalive_timeout: str = DEFAULT_KEEPALIVE_TIMEOUT, keepalive_requests: int = DEFAULT_KEEPALIVE_REQUESTS):
+        """
+        Add a standard HTTP proxy location. With replicas > 1, requests are balanced over ports port..port+replicas-1
+        Connections to the backend are reused, keepalive is the number of idle connections kept open per worker.
+        """
+        self.locations[route] = {
+            "type": "proxy", "port": port, "websocket": False, "replicas": replicas,
+            "keepalive": keepalive, "keepalive_timeout": keepalive_timeout, "keepalive_requests": keepalive_requests
+        }
 
-    def add_websocket_location(self, route: str, port: int):
-        """Add a WebSocket proxy location."""
-        self.locations[route] = {"type": "websocket", "port": port, "websocket": True}
+    def add_websocket_location(self, route: str, port: int, replicas: int = 1):
+        """Add a WebSocket proxy location. With replicas > 1, connections are balanced over ports port..port+replicas-1"""
+        self.locations[route] = {"type": "websocket", "port": port, "websocket": True, "replicas": replicas}
 
     def add_redirect_location(self, route: str, redirect_url: str):
         """Add a location that redirects to a URL."""
         self.locations[route] = {"type": "redirect", "redirect_url": redirect_url}
 
+    def add_static_location(self, route: str, path: str, alias: bool = True, expires: str | None = DEFAULT_STATIC_EXPIRES):
+        """
+        Add a location that serves files from path directly (with sendfile), without going through an app.
+        With alias, /route/x is served from path/x, otherwise from path/route/x (root).
+        expires sets the Expires and Cache-Control headers, e.g. "7d" (None to not set them).
+        """
+        self.locations[route] = {"type": "static", "path": path, "alias": alias, "expires": expires}
+
+    def add_cached_proxy_location(self, route: str, port: int, cache_zone: str, cache_ttl: str = DEFAULT_CACHE_TTL,
+                                  cache_key: str = DEFAULT_CACHE_KEY, cache_max_size: str = DEFAULT_CACHE_MAX_SIZE,
+                                  replicas: int = 1, keepalive: int = DEFAULT_KEEPALIVE,
+                                  keepalive_timeout: str = DEFAULT_KEEPALIVE_TIMEOUT, keepalive_requests: int = DEFAULT_KEEPALIVE_REQUESTS):
+        """
+        Add a proxy location whose responses (200, 301, 302) are cached by nginx for cache_ttl, in the cache zone
+        cache_zone (stored in DEFAULT_CACHE_DIR/cache_zone, at most cache_max_size). Stale responses are served while
+        the backend is down or the entry is being refreshed.
+        """
+        self.add_proxy_location(route, port, replicas=replicas, keepalive=keepalive,
+                                keepalive_timeout=keepalive_timeout, keepalive_requests=keepalive_requests)
+        self.locations[route].update({
+            "type": "proxy_cache", "cache_zone": cache_zone, "cache_ttl": cache_ttl,
+            "cache_key": cache_key, "cache_max_size": cache_max_size
+        })
+
+    def set_compression(self, gzip: bool = True, brotli: bool = False, level: int = 5, min_length: int = 1024,
+                        types: list | None = None):
+        """
+        Compress responses of all locations of the server. brotli needs the ngx_brotli module.
+        types are the mime types to compress (text/html is always compressed).
+        """
+        self.compression = {
+            "gzip": gzip, "brotli": brotli, "level": level, "min_length": min_length,
+            "types": types if types is not None else list(DEFAULT_COMPRESSION_TYPES)
+        }
+
+    def set_tls(self, **settings):
+        """
+        Change the TLS settings of the HTTPS server, see DEFAULT_TLS for the settings and their defaults.
+        preset is one of TLS_PRESETS, stapling enables OCSP stapling (needs resolver and trusted_certificate).
+        """
+        unknown = set(settings) - set(DEFAULT_TLS)
+        if unknown:
+            raise ValueError(f"Unknown TLS settings: {', '.join(sorted(unknown))}")
+        preset = settings.get("preset", self.tls.get("preset"))
+        if preset not in TLS_PRESETS:
+            raise ValueError(f"Unknown TLS preset {preset}, use one of: {', '.join(TLS_PRESETS)}")
+        tls = {**DEFAULT_TLS, **self.tls, **settings}
+        if tls["stapling"] and not (tls["resolver"] and tls["trusted_certificate"]):
+            raise ValueError("TLS stapling needs a resolver and a trusted_certificate")
+        self.tls.update(settings)
+
+    def _generate_tls_block(self):
+        tls = {**DEFAULT_TLS, **self.tls}
+        preset = TLS_PRESETS[tls["preset"]]
+        protocols = tls["protocols"] or preset["protocols"]
+        ciphers = tls["ciphers"] or preset["ciphers"]
+
+        block = f"    ssl_protocols {protocols};\n"
+        if ciphers:
+            block += f"    ssl_ciphers {ciphers};\n"
+        # The listed ciphers are all strong, let clients pick the fastest for their hardware
+        block += "    ssl_prefer_server_ciphers off;\n"
+        if tls["session_cache"]:
+            block += f"    ssl_session_cache {tls['session_cache']};\n"
+            block += f"    ssl_session_timeout {tls['session_timeout']};\n"
+        block += f"    ssl_session_tickets {'on' if tls['session_tickets'] else 'off'};\n"
+        if tls["stapling"]:
+            block += "    ssl_stapling on;\n"
+            block += "    ssl_stapling_verify on;\n"
+            block += f"    ssl_trusted_certificate {tls['trusted_certificate']};\n"
+            block += f"    resolver {tls['resolver']} valid=300s;\n"
+        return block + "\n"
+
+    # --- Upstream Block Generator ---
+    def _upstream_name(self, cfg):
+        """
+        Name of the upstream of a proxy location, unique per server, port, replicas and keepalive settings,
+        e.g. example_com_10001, or example_com_10001_x4_ka32_1000_60s if they are not the defaults.
+        """
+        server_name = re.sub(r"[^A-Za-z0-9_]", "_", self.server_name)
+        name = f"{server_name}_{cfg['port']}"
+        if cfg.get("replicas", 1) > 1:
+            name += f"_x{cfg['replicas']}"
+        keepalive = self._keepalive(cfg)
+        timeout = cfg.get("keepalive_timeout", DEFAULT_KEEPALIVE_TIMEOUT)
+        requests = cfg.get("keepalive_requests", DEFAULT_KEEPALIVE_REQUESTS)
+        if keepalive == 0:
+            name += "_ka0"
+        elif (keepalive, timeout, requests) != (DEFAULT_KEEPALIVE, DEFAULT_KEEPALIVE_TIMEOUT, DEFAULT_KEEPALIVE_REQUESTS):
+            name += f"_ka{keepalive}_{requests}_{re.sub(r'[^A-Za-z0-9]', '', str(timeout))}"
+        return name
+
+    @staticmethod
+    def _keepalive(cfg):
+        """Size of the backend connection pool of a location (0 for websockets, which hold their connection)."""
+        if cfg["type"] not in ("proxy", "proxy_cache"):
+            return 0
+        return cfg.get("keepalive", DEFAULT_KEEPALIVE)
+
+    def _uses_upstream(self, cfg):
+        return cfg["type"] in ("proxy", "proxy_cache", "websocket") and (cfg.get("replicas", 1) > 1 or self._keepalive(cfg) > 0)
+
+    def _generate_upstream_blocks(self):
+        """
+        upstream blocks for the proxy locations that keep connections to the backend alive,
+        or that are balanced over several replicas. Locations with the same port and settings share an upstream.
+        """
+        blocks = ""
+        generated = set()
+        for cfg in self.locations.values():
+            if not self._uses_upstream(cfg):
+                continue
+            name = self._upstream_name(cfg)
+            if name in generated:
+                continue
+            generated.add(name)
+            blocks += f"upstream {name} {{\n"
+            for port in range(cfg["port"], cfg["port"] + cfg.get("replicas", 1)):
+                blocks += f"    server 127.0.0.1:{port};\n"
+            keepalive = self._keepalive(cfg)
+            if keepalive > 0:
+                blocks += f"    keepalive {keepalive};\n"
+                blocks += f"    keepalive_timeout {cfg.get('keepalive_timeout', DEFAULT_KEEPALIVE_TIMEOUT)};\n"
+                blocks += f"    keepalive_requests {cfg.get('keepalive_requests', DEFAULT_KEEPALIVE_REQUESTS)};\n"
+            blocks += "}\n\n"
+        return blocks
+
+    def _generate_cache_path_blocks(self):
+        """proxy_cache_path for every cache zone used by the locations."""
+        blocks = ""
+        generated = set()
+        for cfg in self.locations.values():
+            if cfg["type"] != "proxy_cache" or cfg["cache_zone"] in generated:
+                continue
+            zone = cfg["cache_zone"]
+            generated.add(zone)
+            blocks += (f"proxy_cache_path {DEFAULT_CACHE_DIR}/{zone} levels=1:2 keys_zone={zone}:10m "
+                       f"max_size={cfg.get('cache_max_size', DEFAULT_CACHE_MAX_SIZE)} inactive=60m use_temp_path=off;\n")
+        if blocks:
+            blocks += "\n"
+        return blocks
+
+    def _generate_compression_block(self):
+        compression = self.compression
+        if not compression:
+            return ""
+        types = " ".join(compression.get("types", DEFAULT_COMPRESSION_TYPES))
+        block = ""
+        if compression.get("gzip"):
+            block += "    gzip on;\n"
+            # gzip levels go up to 9, brotli levels up to 11
+            block += f"    gzip_comp_level {min(compression.get('level', 5), 9)};\n"
+            block += f"    gzip_min_length {compression.get('min_length', 1024)};\n"
+            block += "    gzip_proxied any;\n"
+            block += "    gzip_vary on;\n"
+            block += f"    gzip_types {types};\n"
+        if compression.get("brotli"):
+            block += "    brotli on;\n"
+            block += f"    brotli_comp_level {compression.get('level', 5)};\n"
+            block += f"    brotli_min_length {compression.get('min_length', 1024)};\n"
+            block += f"    brotli_types {types};\n"
+        if block:
+            block += "\n"
+        return block
+
     # --- Location Block Generator ---
     def _generate_location_block(self, route, cfg):
         block = f"    location {route} {{\n"
         if cfg["type"] == "redirect":
             block += f"        return 301 {cfg['redirect_url']};\n"
+        elif cfg["type"] == "static":
+            path = cfg["path"]
+            if cfg.get("alias", True):
+                # alias replaces the route, so both need the same trailing slash
+                if route.endswith("/") and not path.endswith("/"):
+                    path += "/"
+                block += f"        alias {path};\n"
+            else:
+                block += f"        root {path};\n"
+            block += "        sendfile on;\n"
+            block += "        tcp_nopush on;\n"
+            if cfg.get("expires"):
+                block += f"        expires {cfg['expires']};\n"
         else:
-            block += f"        proxy_pass http://127.0.0.1:{cfg['port']};\n"
+            if self._uses_upstream(cfg):
+                block += f"        proxy_pass http://{self._upstream_name(cfg)};\n"
+            else:
+                block += f"        proxy_pass http://127.0.0.1:{cfg['port']};\n"
             block += f"        proxy_set_header X-Real-IP $remote_addr;\n"
             block += f"        proxy_set_header Host $host;\n"
             block += f"        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;\n"
@@ -95,6 +330,18 @@ class NginxServer:
                 block += f"        proxy_set_header Upgrade $http_upgrade;\n"
                 block += f"        proxy_set_header Connection \"upgrade\";\n"
                 #block += f"        proxy_set_header Origin $http_origin;\n"
+            elif self._keepalive(cfg) > 0:
+                # Needed to reuse upstream connections, nginx sends HTTP/1.0 and "Connection: close" by default
+                block += "        proxy_http_version 1.1;\n"
+                block += "        proxy_set_header Connection \"\";\n"
+            if cfg["type"] == "proxy_cache":
+                block += f"        proxy_cache {cfg['cache_zone']};\n"
+                block += f"        proxy_cache_key \"{cfg.get('cache_key', DEFAULT_CACHE_KEY)}\";\n"
+                block += f"        proxy_cache_valid 200 301 302 {cfg.get('cache_ttl', DEFAULT_CACHE_TTL)};\n"
+                block += "        proxy_cache_use_stale error timeout updating http_500 http_502 http_503 http_504;\n"
+                block += "        proxy_cache_background_update on;\n"
+                block += "        proxy_cache_lock on;\n"
+                block += "        add_header X-Cache-Status $upstream_cache_status;\n"
         block += f"    }}\n"
         return block
 
@@ -104,6 +351,9 @@ class NginxServer:
         server_block += f"    listen {listen_port}"
         if ssl:
             server_block += " ssl"
+            # "listen ... http2" rather than "http2 on", which needs nginx 1.25.1 or newer
+            if self.tls.get("http2", DEFAULT_TLS["http2"]):
+                server_block += " http2"
         server_block += ";\n"
         server_block += f"    server_name {self.server_name};\n\n"
         #server_block += f"    server_name_in_redirect off;\n"
@@ -112,13 +362,15 @@ class NginxServer:
             if not self.ssl_cert or not self.ssl_key:
                 raise ValueError("SSL certificate and key must be provided for HTTPS")
             server_block += f"    ssl_certificate {self.ssl_cert};\n"
-            server_block += f"    ssl_certificate_key {self.ssl_key};\n\n"
+            server_block += f"    ssl_certificate_key {self.ssl_key};\n"
+            server_block += self._generate_tls_block()
 
         if redirect_to_https:
             server_block += "    location / {\n"
             server_block += "       return 301 https://$host$request_uri;\n"
             server_block += "    }\n"
         else:
+            server_block += self._generate_compression_block()
             for route, cfg in self.locations.items():
                 server_block += self._generate_location_block(route, cfg)
 
@@ -127,7 +379,7 @@ class NginxServer:
 
     # --- Full Config Generator ---
     def generate_config(self):
-        config = ""
+        config = self._generate_upstream_blocks() + self._generate_cache_path_blocks()
         use_https = self.ssl_key is not None
 
         # Generate http code
@@ -147,7 +399,9 @@ class NginxServer:
             "server_name": self.server_name,
             "ssl_cert": self.ssl_cert,
             "ssl_key": self.ssl_key,
-            "locations": self.locations
+            "locations": self.locations,
+            "compression": self.compression,
+            "tls": self.tls
         }
 
     @classmethod
@@ -159,4 +413,6 @@ class NginxServer:
             ssl_key=data.get("ssl_key"),
         )
         server.locations = data.get("locations", {})
+        server.compression = data.get("compression")
+        server.tls = {**DEFAULT_TLS, **data.get("tls", {})}
         return server
\ No newline at end of file
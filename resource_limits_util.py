@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import subprocess
+import psutil
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Keys accepted in the "limits" section of an app config
+RESOURCE_LIMIT_KEYS = {
+    "memory_mb",          # cgroup v2 memory.max, the app (and its children) is OOM killed beyond it
+    "address_space_mb",   # RLIMIT_AS, allocations beyond it fail
+    "max_open_files",     # RLIMIT_NOFILE
+    "nice",               # CPU priority, 0 (default) to 19 (lowest)
+    "cpu_affinity",       # List of CPU numbers the app may run on
+    "cpu_percent",        # cgroup v2 cpu.max, in percent of one CPU (200 = two CPUs)
+}
+
+CGROUP_CPU_PERIOD_US = 100000
+
+
+def validate_resource_limits(limits: dict):
+    """Raise ValueError if limits contains unknown keys or invalid values."""
+    if not isinstance(limits, dict):
+        raise ValueError("limits must be an object")
+    unknown = set(limits) - RESOURCE_LIMIT_KEYS
+    if unknown:
+        raise ValueError(f"Unknown resource limits: {', '.join(sorted(unknown))}")
+    for key in ("memory_mb", "address_space_mb", "max_open_files", "cpu_percent"):
+        if key in limits and (not isinstance(limits[key], (int, float)) or limits[key] <= 0):
+            raise ValueError(f"{key} must be a positive number")
+    if "nice" in limits and (not isinstance(limits["nice"], int) or not -20 <= limits["nice"] <= 19):
+        raise ValueError("nice must be an integer from -20 to 19")
+    if "cpu_affinity" in limits:
+        cpus = limits["cpu_affinity"]
+        if not isinstance(cpus, list) or not cpus or not all(isinstance(cpu, int) and cpu >= 0 for cpu in cpus):
+            raise ValueError("cpu_affinity must be a non-empty list of CPU numbers")
+        if hasattr(os, "sched_getaffinity"):
+            available = os.sched_getaffinity(0)
+        else:
+            available = set(range(psutil.cpu_count() or 1))
+        unavailable = sorted(set(cpus) - set(available))
+        if unavailable:
+            raise ValueError(f"cpu_affinity contains CPUs that are not available: {', '.join(map(str, unavailable))}")
+
+
+def is_cgroup_v2_available(cgroup_root: str) -> bool:
+    """True if cgroup_root is a cgroup v2 directory (delegated to this user, e.g. /sys/fs/cgroup/pyappmanager)."""
+    return os.path.isfile(os.path.join(cgroup_root, "cgroup.controllers"))
+
+
+def _write_cgroup_file(cgroup_dir: str, name: str, value: str):
+    with open(os.path.join(cgroup_dir, name), "w") as f:
+        f.write(value)
+
+
+def setup_app_cgroup(cgroup_root: str, app_name: str, limits: dict) -> str:
+    """
+    Create (or update) the cgroup of an app below cgroup_root, and write its memory and cpu limits.
+    Limits that are not set are reset to "max", so removing them from the config takes effect on restart.
+    Returns the path of the cgroup.
+    """
+    try:
+        # Let child cgroups use the memory and cpu controllers, fails if they are already enabled by the owner
+        _write_cgroup_file(cgroup_root, "cgroup.subtree_control", "+memory +cpu")
+    except OSError:
+        pass
+
+    cgroup_dir = os.path.join(cgroup_root, app_name)
+    os.makedirs(cgroup_dir, exist_ok=True)
+
+    memory_max = str(int(limits["memory_mb"] * 1024 * 1024)) if "memory_mb" in limits else "max"
+    _write_cgroup_file(cgroup_dir, "memory.max", memory_max)
+
+    if "cpu_percent" in limits:
+        quota = int(CGROUP_CPU_PERIOD_US * limits["cpu_percent"] / 100)
+        _write_cgroup_file(cgroup_dir, "cpu.max", f"{quota} {CGROUP_CPU_PERIOD_US}")
+    else:
+        _write_cgroup_file(cgroup_dir, "cpu.max", f"max {CGROUP_CPU_PERIOD_US}")
+    return cgroup_dir
+
+
+def prepare_resource_limits(limits: dict, cgroup_root: str | None = None, cgroup_name: str | None = None) -> dict | None:
+    """
+    Work out how to apply limits (see RESOURCE_LIMIT_KEYS) to an app, for popen_with_resource_limits.
+    memory_mb and cpu_percent need cgroup v2 (cgroup_root), the cgroup is set up here, the app only joins it.
+    Limits that are not supported on this system are skipped with a warning. Returns None if there is nothing to apply.
+    """
+    if not limits:
+        return None
+    if os.name == "nt":
+        print("prepare_resource_limits", "resource limits are not supported on Windows, skipped")
+        return None
+
+    plan = {"cgroup_procs": None, "rlimits": [], "nice": limits.get("nice"), "cpu_affinity": limits.get("cpu_affinity")}
+    if "memory_mb" in limits or "cpu_percent" in limits:
+        if cgroup_root and is_cgroup_v2_available(cgroup_root):
+            cgroup_dir = setup_app_cgroup(cgroup_root, cgroup_name, limits)
+            plan["cgroup_procs"] = os.path.join(cgroup_dir, "cgroup.procs")
+        else:
+            print("prepare_resource_limits", "memory_mb and cpu_percent need a cgroup v2 cgroup_root, skipped")
+
+    if "address_space_mb" in limits:
+        plan["rlimits"].append(("RLIMIT_AS", int(limits["address_space_mb"] * 1024 * 1024)))
+    if "max_open_files" in limits:
+        plan["rlimits"].append(("RLIMIT_NOFILE", int(limits["max_open_files"])))
+    if plan["rlimits"] and resource is None:
+        print("prepare_resource_limits", "rlimits are not supported on this system, skipped")
+        plan["rlimits"] = []
+
+    if plan["cpu_affinity"] is not None and not hasattr(os, "sched_setaffinity"):
+        print("prepare_resource_limits", "cpu_affinity is not supported on this system, skipped")
+        plan["cpu_affinity"] = None
+    return plan
+
+
+def popen_with_resource_limits(command: list[str], plan: dict, **popen_kwargs) -> subprocess.Popen:
+    """
+    Start command through a small bootstrap process (this file run as a script), that joins the cgroup and
+    applies the limits of plan (see prepare_resource_limits) to itself, and then execs command.
+    So the app and everything it starts is limited from its first instruction, and nothing runs between fork
+    and exec in this (multi-threaded) process.
+    Raises OSError, after the bootstrap process has exited, if a limit could not be applied.
+    """
+    # The bootstrap writes errors to the pipe. On success the write end is closed by exec, so the read returns empty
+    read_fd, write_fd = os.pipe()
+    try:
+        popen = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), json.dumps(plan), str(write_fd)] + command,
+            pass_fds=(write_fd,),
+            **popen_kwargs
+        )
+    finally:
+        os.close(write_fd)
+    with os.fdopen(read_fd, "rb") as status:
+        error = status.read()
+    if error:
+        popen.wait()
+        raise OSError(f"Could not apply resource limits: {error.decode('utf-8', errors='replace')}")
+    return popen
+
+
+def _apply_resource_limits_and_exec(plan: dict, status_fd: int, command: list[str]):
+    try:
+        # Join the cgroup first, so nothing the app starts can escape it
+        if plan["cgroup_procs"] is not None:
+            with open(plan["cgroup_procs"], "w") as f:
+                f.write(str(os.getpid()))
+        for name, value in plan["rlimits"]:
+            _, hard = resource.getrlimit(getattr(resource, name))
+            if hard != resource.RLIM_INFINITY:
+                value = min(value, hard)
+            resource.setrlimit(getattr(resource, name), (value, value))
+        if plan["nice"] is not None:
+            os.setpriority(os.PRIO_PROCESS, 0, plan["nice"])
+        if plan["cpu_affinity"] is not None:
+            os.sched_setaffinity(0, plan["cpu_affinity"])
+        os.set_inheritable(status_fd, False)
+        os.execv(command[0], command)
+    except Exception as e:
+        os.write(status_fd, f"{type(e).__name__}: {e}".encode("utf-8"))
+        os._exit(126)
+
+
+if __name__ == "__main__":
+    # Bootstrap process of popen_with_resource_limits: <plan json> <status fd> <command...>
+    _apply_resource_limits_and_exec(json.loads(sys.argv[1]), int(sys.argv[2]), sys.argv[3:])